@@ -13,7 +13,14 @@ import shlex
 import logging
 from logging.handlers import QueueHandler
 import queue
+import zlib
+import json
+import html
+import struct
+import heapq
+import itertools
 import collections
+from concurrent.futures import ThreadPoolExecutor, Future
 from collections import Counter
 import threading
 import asyncio
@@ -287,6 +294,7 @@ class Config(GObject.Object):
 @define-color preview_drawing_border #ffffff;
 @define-color preview_static_border #e6e6e6;
 @define-color preview_delete_line #ff1a1a;
+@define-color preview_minimap_viewport rgba(255, 255, 255, 0.35);
 """.strip(),
         'config_panel': """
 .config-container { margin: 20px; }
@@ -341,6 +349,10 @@ class Config(GObject.Object):
             'enable_free_scroll_matching': ('bool', 'true'),
             'auto_scroll_ticks_per_step': ('int', '2'),
             'auto_scroll_interval_ms': ('int', '300'),
+            'auto_scroll_max_pending': ('int', '2'),
+            'auto_scroll_max_lag_ms': ('int', '1500'),
+            'auto_scroll_adaptive_step': ('bool', 'true'),
+            'auto_scroll_min_overlap': ('int', '150'), # 缓冲区px
             'scroll_method': ('str', 'move_user_cursor'),
             'reuse_invisible_cursor': ('bool', 'false'),
             'grid_scroll_interval_ms': ('int', '200'),
@@ -394,6 +406,10 @@ class Config(GObject.Object):
             'jpeg_quality': ('int', '80'),
             'filename_template': ('str', '长截图 {timestamp}'),
             'filename_timestamp_format': ('str', '%Y-%m-%d %H-%M-%S'),
+            'encoder_threads': ('int', '0'),
+            'page_max_height': ('int', '0'), # 缓冲区px
+            'encode_preset': ('str', 'balanced'),
+            'webp_lossless': ('bool', 'true'),
         },
         'System': {
             'max_viewer_dimension': ('int', '32767'), # 缓冲区px
@@ -408,8 +424,12 @@ class Config(GObject.Object):
         },
         'Preview': {
             'preview_cache_size': ('int', '20'),
+            'preview_cache_memory_mb': ('int', '512'),
+            'preview_loader_threads': ('int', '2'),
+            'preview_compressed_cache_mb': ('int', '256'),
             'preview_drag_sensitivity': ('float', '2.0'),
             'preview_autoscroll_sensitivity': ('float', '1.0'),
+            'preview_show_minimap': ('bool', 'true'),
             'preview_zoom_factor': ('float', '1.26'),
             'preview_min_zoom': ('float', '0.25'),
             'preview_max_zoom': ('float', '4.0'),
@@ -422,6 +442,8 @@ class Config(GObject.Object):
             # 缓冲区px }
             'thres_score': ('float', '5.0'),
             'thres_texture': ('float', '3.0'),
+            'decoded_frame_cache_size': ('int', '4'),
+            'incremental_composite': ('bool', 'true'),
         },
         'Hotkeys': {
             'capture': ('hotkey', 'space'),
@@ -915,12 +937,13 @@ class SystemInteraction:
                 return False, combined_error
         try:
             file_info, w, h = GdkPixbuf.Pixbuf.get_file_info(str_path)
-            if file_info:
-                raw_size = w * h * 4
-                SAFE_LIMIT = 500 * 1024 * 1024
-                if raw_size > SAFE_LIMIT:
-                    logging.warning(f"图片原始数据过大（{raw_size/1024/1024:.0f} MB），跳过位图复制")
-                    return _copy_path_fallback(str_path, "图片过大（>500MB），已改为复制路径")
+            if not file_info:
+                return _copy_path_fallback(str_path, "并已复制文件路径到剪贴板")
+            raw_size = w * h * 4
+            SAFE_LIMIT = 500 * 1024 * 1024
+            if raw_size > SAFE_LIMIT:
+                logging.warning(f"图片原始数据过大（{raw_size/1024/1024:.0f} MB），跳过位图复制")
+                return _copy_path_fallback(str_path, "图片过大（>500MB），已改为复制路径")
             pixbuf = GdkPixbuf.Pixbuf.new_from_file(str_path)
             clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
             clipboard.set_image(pixbuf)
@@ -999,6 +1022,18 @@ class SystemInteraction:
         except Exception as e:
             logging.error(f"执行残留目录清理时发生未知错误: {e}")
 
+    @classmethod
+    def get_available_memory(cls):
+        """读取 /proc/meminfo 中的可用内存 (字节)，无法获取时返回 None"""
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError) as e:
+            logging.debug(f"读取可用内存失败: {e}")
+        return None
+
     @classmethod
     def check_dependencies(cls):
         optional_deps = {
@@ -1839,10 +1874,7 @@ class ImageMatcher:
         return final_bot_header, final_bot_footer, w_left, w_right
 
     @staticmethod
-    def verify_region(img_top, img_bottom, shift, match_y_bot, static_bars, box_shift=0):
-        h_top = img_top.shape[0]
-        h_bot = img_bottom.shape[0]
-        w_bot = img_bottom.shape[1]
+    def _verify_geometry(h_top, h_bot, w_bot, shift, match_y_bot, static_bars, box_shift):
         bot_h_header, bot_h_footer, w_left, w_right = static_bars
         match_y_top = match_y_bot + shift
         if match_y_top < 0:
@@ -1855,15 +1887,44 @@ class ImageMatcher:
         max_h_valid_top = h_top - top_h_footer - match_y_top
         max_h_valid_bot = h_bot - bot_h_footer - match_y_bot
         check_h = min(max_h_valid_top, max_h_valid_bot)
+        return match_y_top, match_y_bot, check_h, w_left, w_bot - w_right
+
+    @staticmethod
+    def _verify_grid(check_h, region_w):
+        rows, cols = 6, 6
+        if check_h < 2 * rows: rows = 1
+        return rows, cols, check_h // rows, region_w // cols
+
+    @staticmethod
+    def precompute_top_textures(img_top, h_bot, w_bot, shift, match_y_bot, static_bars, box_shift=0):
+        """预先计算 verify_region 中只依赖上一张图的网格纹理，下一张图到达时若几何参数一致即可复用"""
+        geometry = ImageMatcher._verify_geometry(img_top.shape[0], h_bot, w_bot, shift, match_y_bot, static_bars, box_shift)
+        match_y_top, _, check_h, w_left, valid_w_end = geometry
+        if check_h <= 0 or valid_w_end <= w_left:
+            return None
+        region_top = img_top[match_y_top : match_y_top + check_h, w_left : valid_w_end]
+        gray_top = cv2.cvtColor(region_top, cv2.COLOR_BGR2GRAY)
+        rows, cols, h_step, w_step = ImageMatcher._verify_grid(check_h, region_top.shape[1])
+        textures = np.zeros((rows, cols), dtype=np.float64)
+        for r in range(rows):
+            for c in range(cols):
+                block = gray_top[r*h_step : (r+1)*h_step, c*w_step : (c+1)*w_step]
+                textures[r, c] = cv2.meanStdDev(block)[1][0][0]
+        return geometry, textures
+
+    @staticmethod
+    def verify_region(img_top, img_bottom, shift, match_y_bot, static_bars, box_shift=0, top_textures=None):
+        h_top = img_top.shape[0]
+        h_bot = img_bottom.shape[0]
+        w_bot = img_bottom.shape[1]
+        geometry = ImageMatcher._verify_geometry(h_top, h_bot, w_bot, shift, match_y_bot, static_bars, box_shift)
+        match_y_top, match_y_bot, check_h, w_left, valid_w_end = geometry
         if check_h <= 0:
             return float('-inf'), match_y_bot
-        valid_w_end = w_bot - w_right
+        textures = top_textures[1] if top_textures is not None and top_textures[0] == geometry else None
         region_top = img_top[match_y_top : match_y_top + check_h, w_left : valid_w_end]
         region_bot = img_bottom[match_y_bot : match_y_bot + check_h, w_left : valid_w_end]
-        rows, cols = 6, 6
-        if check_h < 2 * rows: rows = 1
-        h_step = check_h // rows
-        w_step = region_bot.shape[1] // cols
+        rows, cols, h_step, w_step = ImageMatcher._verify_grid(check_h, region_bot.shape[1])
         score = 0.0
         best_row_score = float('-inf')
         best_row_idx = 0
@@ -1882,7 +1943,10 @@ class ImageMatcher:
                     delta = -1.5
                     debug_grid[r][c] = "X"
                 elif mae < ImageMatcher.THRES_ABS_GOOD:
-                    std_top = cv2.meanStdDev(cv2.cvtColor(b_top, cv2.COLOR_BGR2GRAY))[1][0][0]
+                    if textures is not None:
+                        std_top = textures[r, c]
+                    else:
+                        std_top = cv2.meanStdDev(cv2.cvtColor(b_top, cv2.COLOR_BGR2GRAY))[1][0][0]
                     std_bot = cv2.meanStdDev(cv2.cvtColor(b_bot, cv2.COLOR_BGR2GRAY))[1][0][0]
                     if std_top > ImageMatcher.THRES_TEXTURE and std_bot > ImageMatcher.THRES_TEXTURE:
                         delta = 1.0
@@ -2073,35 +2137,111 @@ class ImageMatcher:
             return best_candidate['shift'], best_candidate['cut_y']
         return None
 
-def stitch_images_in_memory_from_model(render_plan: list, image_width: int, total_height: int, progress_callback=None):
+OUTPUT_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'WEBP': 'webp', 'TIFF': 'tif', 'PDF': 'pdf', 'DZI': 'dzi'}
+WEBP_MAX_DIMENSION = 16383
+ENCODE_PRESETS = {
+    'fast': {'tiff_level': 1, 'tiff_predictor': 1, 'webp_quality': 80},
+    'balanced': {'tiff_level': 6, 'tiff_predictor': 2, 'webp_quality': 90},
+    'small': {'tiff_level': 9, 'tiff_predictor': 2, 'webp_quality': 75},
+}
+
+def encode_preset():
+    """当前的编码速度/体积预设，未知取值时使用 balanced"""
+    preset = ENCODE_PRESETS.get(config.ENCODE_PRESET)
+    if preset is None:
+        logging.warning(f"未知的编码预设 '{config.ENCODE_PRESET}'，使用 balanced")
+        preset = ENCODE_PRESETS['balanced']
+    return preset
+
+def opencv_write_params(save_format):
+    """JPEG / WebP 通过 cv2.imwrite 保存时使用的参数"""
+    if save_format == 'JPEG':
+        return [int(cv2.IMWRITE_JPEG_QUALITY), config.JPEG_QUALITY]
+    # WebP 质量大于 100 时为无损压缩
+    quality = 101 if config.WEBP_LOSSLESS else encode_preset()['webp_quality']
+    return [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+
+def output_thread_count():
+    """保存长图时用于并行解码和压缩的线程数"""
+    return config.ENCODER_THREADS or os.cpu_count() or 1
+
+OUT_OF_CORE_MEMORY_RATIO = 0.5 # 画布占可用内存的比例超过此值时改用磁盘画布
+
+def out_of_core_canvas_path(image_width, total_height):
+    """画布超过可用内存的一半时返回临时目录下的磁盘画布路径，否则返回 None"""
+    canvas_bytes = image_width * total_height * 3
+    available = SystemInteraction.get_available_memory()
+    if available is None or canvas_bytes <= available * OUT_OF_CORE_MEMORY_RATIO:
+        return None
+    logging.info(f"画布 {canvas_bytes / 1024 / 1024:.0f} MB 超过可用内存 {available / 1024 / 1024:.0f} MB 的 {OUT_OF_CORE_MEMORY_RATIO:.0%}，改用磁盘画布")
+    return config.TEMP_DIRECTORY / "final_canvas.rgb"
+
+def _decode_frame(filepath, load_image=None):
+    """优先使用 load_image (如内存压缩缓存)，未命中时从磁盘解码，失败时返回 None"""
+    img = load_image(filepath) if load_image else None
+    if img is None:
+        img = cv2.imread(str(filepath))
+    if img is None:
+        logging.error(f"拼接图片失败 {filepath}：cv2 无法读取图片")
+    return img
+
+def iter_decoded_frames(filepaths, load_image=None, threads=1):
+    """按顺序产出 (filepath, 图片)，后续图片在线程池中提前解码，最多预取 threads * 2 张"""
+    if threads <= 1:
+        for filepath in filepaths:
+            yield filepath, _decode_frame(filepath, load_image)
+        return
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="FrameDecoder") as executor:
+        remaining = iter(filepaths)
+        pending = collections.deque((fp, executor.submit(_decode_frame, fp, load_image)) for fp in itertools.islice(remaining, threads * 2))
+        while pending:
+            filepath, future = pending.popleft()
+            next_filepath = next(remaining, None)
+            if next_filepath is not None:
+                pending.append((next_filepath, executor.submit(_decode_frame, next_filepath, load_image)))
+            yield filepath, future.result()
+
+def stitch_images_in_memory_from_model(render_plan: list, image_width: int, total_height: int, progress_callback=None, load_image=None, threads=1, canvas_path=None):
+    """按渲染计划拼接完整图像，指定 canvas_path 时画布为磁盘上的 np.memmap，不受可用内存限制"""
     if not render_plan:
         return None
     num_pieces = len(render_plan)
-    logging.debug(f"开始从 {num_pieces} 个渲染片段拼接图像，最终尺寸: {image_width}x{total_height}")
-    current_img_path = None
+    logging.debug(f"开始从 {num_pieces} 个渲染片段拼接图像，最终尺寸: {image_width}x{total_height}，解码线程数: {threads}")
+    pieces_by_file = {} # 保持渲染顺序，线程池按此顺序取任务
+    for piece in render_plan:
+        pieces_by_file.setdefault(piece['filepath'], []).append(piece)
     try:
-        stitched_image = np.zeros((total_height, image_width, 3), dtype=np.uint8)
-        for i, piece in enumerate(render_plan):
-            filepath = piece['filepath']
-            src_y = piece['src_y']
-            height = piece['height']
-            dest_y = piece['render_y_start']
+        if canvas_path is not None:
+            logging.info(f"使用磁盘画布拼接: {canvas_path}")
+            Path(canvas_path).parent.mkdir(parents=True, exist_ok=True)
+            stitched_image = np.memmap(canvas_path, dtype=np.uint8, mode='w+', shape=(total_height, image_width, 3))
+        else:
+            stitched_image = np.zeros((total_height, image_width, 3), dtype=np.uint8)
+        def compose_file(filepath, pieces):
+            # 各片段的目标行互不重叠，可以在多个线程中同时写入
             try:
-                if filepath != current_img_path:
-                    current_img = cv2.imread(str(filepath))
-                    if current_img is None:
-                        raise ValueError(f"cv2 无法读取图片: {filepath}")
-                    current_img_path = filepath
-                img_h, img_w = current_img.shape[:2]
+                img = _decode_frame(filepath, load_image)
+                if img is None:
+                    return
+                img_h, img_w = img.shape[:2]
                 if img_w != image_width:
                     logging.warning(f"图片片段 {filepath} 宽度 {img_w} 与预期 {image_width} 不符")
-                copy_h = min(height, img_h - src_y)
                 copy_w = min(image_width, img_w)
-                stitched_image[dest_y:dest_y + copy_h, :copy_w] = current_img[src_y:src_y + copy_h, :copy_w]
+                for piece in pieces:
+                    src_y = piece['src_y']
+                    dest_y = piece['render_y_start']
+                    copy_h = max(0, min(piece['height'], img_h - src_y))
+                    stitched_image[dest_y:dest_y + copy_h, :copy_w] = img[src_y:src_y + copy_h, :copy_w]
             except Exception as e_load:
                 logging.error(f"拼接图片失败 {filepath}：{e_load}")
-            if progress_callback:
-                progress_callback((i + 1) / num_pieces)
+        done_pieces = 0
+        with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="StitchDecoder") as executor:
+            futures = [(executor.submit(compose_file, fp, pieces), len(pieces)) for fp, pieces in pieces_by_file.items()]
+            for future, count in futures:
+                future.result()
+                done_pieces += count
+                if progress_callback:
+                    progress_callback(done_pieces / num_pieces)
         logging.info("图像拼接完成")
         return stitched_image
     except Exception as e:
@@ -2109,8 +2249,1196 @@ def stitch_images_in_memory_from_model(render_plan: list, image_width: int, tota
         logging.error(msg)
         GLib.idle_add(send_notification, "拼接失败", msg, "critical", "dialog-error")
         return None
+
+def iter_render_plan_bands(render_plan, image_width, total_height, band_height, load_image=None, progress_callback=None, threads=1):
+    """按行带遍历渲染计划，依次产出 (band_y, band)，band 是复用缓冲区的 BGR 视图"""
+    buffer = np.zeros((min(band_height, total_height), image_width, 3), dtype=np.uint8)
+    num_pieces = len(render_plan)
+    # 同一截图的片段在渲染层中是连续的，按首次出现的顺序预取即可
+    frames = iter_decoded_frames(list(dict.fromkeys(piece['filepath'] for piece in render_plan)), load_image, threads)
+    piece_index = 0
+    current_img_path = None
+    current_img = None
+    for band_y in range(0, total_height, band_height):
+        band_end = min(band_y + band_height, total_height)
+        band = buffer[:band_end - band_y]
+        band.fill(0)
+        while piece_index < num_pieces and render_plan[piece_index]['render_y_start'] + render_plan[piece_index]['height'] <= band_y:
+            piece_index += 1
+        i = piece_index
+        while i < num_pieces and render_plan[i]['render_y_start'] < band_end:
+            piece = render_plan[i]
+            i += 1
+            filepath = piece['filepath']
+            if filepath != current_img_path:
+                current_img_path, current_img = next(frames)
+                if current_img is not None and current_img.shape[1] != image_width:
+                    logging.warning(f"图片片段 {filepath} 宽度 {current_img.shape[1]} 与预期 {image_width} 不符")
+            if current_img is None:
+                continue
+            dest_y = piece['render_y_start']
+            copy_y1 = max(dest_y, band_y)
+            copy_y2 = min(dest_y + min(piece['height'], current_img.shape[0] - piece['src_y']), band_end)
+            if copy_y2 <= copy_y1:
+                continue
+            src_y1 = piece['src_y'] + copy_y1 - dest_y
+            copy_w = min(image_width, current_img.shape[1])
+            band[copy_y1 - band_y:copy_y2 - band_y, :copy_w] = current_img[src_y1:src_y1 + copy_y2 - copy_y1, :copy_w]
+        if progress_callback:
+            progress_callback(band_end / total_height)
+        yield band_y, band
+
+def _adler32_combine(adler1, adler2, len2):
+    """合并两段数据的 adler32 校验和 (对应 zlib 的 adler32_combine)"""
+    base = 65521
+    rem = len2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % base
+    sum1 = (sum1 + (adler2 & 0xffff) + base - 1) % base
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + base - rem) % base
+    return sum1 | (sum2 << 16)
+
+class StreamingPNGWriter:
+    """按行带增量写出 8 位 RGB PNG，整张图片不会同时驻留内存
+
+    每个行带独立压缩为以同步刷新结尾的 deflate 块，再按顺序拼接成同一个 zlib 流，
+    因此可以交给线程池并行压缩（zlib 压缩时会释放 GIL）
+    """
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+    BAND_HEIGHT = 256
+    FILTER_UP = 2
+    WINDOW_SIZE = 32768
+    COMPRESSION_LEVEL = 3
+
+    def __init__(self, path, width, height, compression_level=COMPRESSION_LEVEL, threads=1):
+        self.path = Path(path)
+        self.width = width
+        self.height = height
+        self.compression_level = compression_level
+        self.rows_written = 0
+        self._prev_row = np.zeros((width * 3,), dtype=np.uint8)
+        self._prev_tail = b''
+        self._adler = zlib.adler32(b'')
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="PNGEncoder") if threads > 1 else None
+        self._max_pending = max(1, threads) * 2
+        self._pending = collections.deque()
+        self._file = open(self.path, 'wb')
+        self._file.write(self.SIGNATURE)
+        ihdr = width.to_bytes(4, 'big') + height.to_bytes(4, 'big') + bytes((8, 2, 0, 0, 0))
+        self._write_chunk(b'IHDR', ihdr)
+        # zlib 头与压缩级别对应，压缩块本身使用不带头尾的原始 deflate
+        self._write_chunk(b'IDAT', zlib.compress(b'', compression_level)[:2])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @classmethod
+    def filter_band(cls, band_bgr, prev_row):
+        """将 BGR 行带转为带 Up 滤波字节的 PNG 扫描线，prev_row 为上一行的 RGB 数据"""
+        rows = band_bgr.shape[0]
+        rgb = band_bgr[:, :, ::-1].reshape(rows, -1)
+        scanlines = np.empty((rows, rgb.shape[1] + 1), dtype=np.uint8)
+        scanlines[:, 0] = cls.FILTER_UP
+        np.subtract(rgb[:1], prev_row, out=scanlines[:1, 1:])
+        np.subtract(rgb[1:], rgb[:-1], out=scanlines[1:, 1:])
+        return scanlines, rgb[-1].copy()
+
+    @staticmethod
+    def compress_block(data, level, zdict):
+        """压缩一个独立块，以上一块末尾 32KB 作为预设字典，结果可以直接拼接"""
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict) if zdict else zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    @classmethod
+    def state_before(cls, canvas, band_y, band_height=BAND_HEIGHT):
+        """由画布计算从 band_y 开始写入时的滤波上一行和预设字典，与顺序写入到此处时的状态一致"""
+        if band_y == 0:
+            return np.zeros((canvas.shape[1] * 3,), dtype=np.uint8), b''
+        row_bytes = canvas.shape[1] * 3 + 1
+        start = band_y - min(band_height, -(-cls.WINDOW_SIZE // row_bytes))
+        prev_row = canvas[start - 1, :, ::-1].reshape(-1) if start > 0 else np.zeros((canvas.shape[1] * 3,), dtype=np.uint8)
+        scanlines, last_row = cls.filter_band(canvas[start:band_y], prev_row)
+        return last_row, scanlines.reshape(-1)[-cls.WINDOW_SIZE:].tobytes()
+
+    @classmethod
+    def encode_band(cls, band_bgr, prev_row, prev_tail, compression_level=COMPRESSION_LEVEL):
+        """独立编码一个行带，返回 (压缩块, adler32, 扫描线字节数)，可交给 write_encoded 直接写入"""
+        scanlines, _ = cls.filter_band(band_bgr, prev_row)
+        data = scanlines.reshape(-1)
+        return cls.compress_block(data, compression_level, prev_tail), zlib.adler32(data), data.nbytes
+
+    def set_state(self, prev_row, prev_tail):
+        """在写入预编码行带之后恢复顺序编码所需的状态"""
+        self._prev_row = prev_row
+        self._prev_tail = prev_tail
+
+    def write_encoded(self, rows, block, adler, nbytes):
+        """追加一个由 encode_band 预先编码好的行带"""
+        self._adler = _adler32_combine(self._adler, adler, nbytes)
+        self.rows_written += rows
+        if self._executor is None:
+            self._write_chunk(b'IDAT', block)
+            return
+        future = Future()
+        future.set_result(block)
+        self._pending.append(future)
+        self._drain_pending()
+
+    def write_band(self, band_bgr):
+        """追加若干行 BGR 像素"""
+        scanlines, self._prev_row = self.filter_band(band_bgr, self._prev_row)
+        data = scanlines.reshape(-1)
+        self._adler = zlib.adler32(data, self._adler)
+        zdict = self._prev_tail
+        self._prev_tail = data[-self.WINDOW_SIZE:].tobytes()
+        self.rows_written += band_bgr.shape[0]
+        if self._executor is None:
+            self._write_chunk(b'IDAT', self.compress_block(data, self.compression_level, zdict))
+            return
+        self._pending.append(self._executor.submit(self.compress_block, data, self.compression_level, zdict))
+        self._drain_pending()
+
+    def _drain_pending(self):
+        while len(self._pending) >= self._max_pending or (self._pending and self._pending[0].done()):
+            self._write_chunk(b'IDAT', self._pending.popleft().result())
+
+    def close(self):
+        try:
+            while self._pending:
+                self._write_chunk(b'IDAT', self._pending.popleft().result())
+        except BaseException:
+            self.abort()
+            raise
+        if self.rows_written != self.height:
+            self.abort()
+            raise RuntimeError(f"PNG 行数不完整: 已写入 {self.rows_written}/{self.height} 行")
+        # 空的结束块 + adler32 校验和
+        tail = zlib.compressobj(self.compression_level, zlib.DEFLATED, -15).flush()
+        self._write_chunk(b'IDAT', tail + self._adler.to_bytes(4, 'big'))
+        self._write_chunk(b'IEND', b'')
+        self._file.close()
+        self._shutdown_executor()
+
+    def abort(self):
+        """关闭并删除未写完的文件"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._shutdown_executor()
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(len(data).to_bytes(4, 'big'))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(zlib.crc32(data, zlib.crc32(chunk_type)).to_bytes(4, 'big'))
+
+def iter_canvas_bands(canvas, band_height, progress_callback=None):
+    """按行带遍历已拼接好的画布，产出 (band_y, band)"""
+    total_height = canvas.shape[0]
+    for band_y in range(0, total_height, band_height):
+        band_end = min(band_y + band_height, total_height)
+        if progress_callback:
+            progress_callback(band_end / total_height)
+        yield band_y, canvas[band_y:band_end]
+
+def write_png_from_bands(output_file, image_width, total_height, bands, threads=None):
+    """把按顺序产出的行带编码为 PNG"""
+    threads = threads or output_thread_count()
+    logging.debug(f"PNG 压缩线程数: {threads}")
+    with StreamingPNGWriter(output_file, image_width, total_height, threads=threads) as writer:
+        for _, band in bands:
+            writer.write_band(band)
+    return True
+
+def write_png_from_canvas(output_file, canvas, encoded_blocks=(), progress_callback=None):
+    """把画布编码为 PNG，开头已预编码的行带直接写入，只压缩剩余部分"""
+    total_height, image_width = canvas.shape[:2]
+    band_height = StreamingPNGWriter.BAND_HEIGHT
+    threads = output_thread_count()
+    logging.debug(f"PNG 压缩线程数: {threads}，已预编码 {len(encoded_blocks)} 个行带")
+    with StreamingPNGWriter(output_file, image_width, total_height, threads=threads) as writer:
+        for k, (band_y, band) in enumerate(iter_canvas_bands(canvas, band_height, progress_callback)):
+            if k < len(encoded_blocks):
+                writer.write_encoded(band.shape[0], *encoded_blocks[k])
+                continue
+            if k > 0 and k == len(encoded_blocks):
+                writer.set_state(*StreamingPNGWriter.state_before(canvas, band_y, band_height))
+            writer.write_band(band)
+    return True
+
+def write_png_from_render_plan(output_file, render_plan, image_width, total_height, progress_callback=None, load_image=None, threads=None):
+    """按渲染计划逐行带拼接并直接编码为 PNG，峰值内存只与宽度和行带高度有关"""
+    if not render_plan:
+        return False
+    logging.debug(f"开始流式写出 PNG: {len(render_plan)} 个渲染片段，最终尺寸: {image_width}x{total_height}")
+    threads = threads or output_thread_count()
+    bands = iter_render_plan_bands(render_plan, image_width, total_height, StreamingPNGWriter.BAND_HEIGHT, load_image, progress_callback, threads)
+    return write_png_from_bands(output_file, image_width, total_height, bands, threads)
+
+def slice_render_plan(render_plan, y0, y1):
+    """截取渲染计划中 [y0, y1) 的部分，返回以 y0 为原点的片段列表"""
+    starts = [piece['render_y_start'] for piece in render_plan]
+    i = max(0, bisect.bisect_right(starts, y0) - 1)
+    pieces = []
+    for piece in render_plan[i:]:
+        start = piece['render_y_start']
+        if start >= y1:
+            break
+        end = start + piece['height']
+        top, bottom = max(start, y0), min(end, y1)
+        if top >= bottom:
+            continue
+        pieces.append(dict(piece, render_y_start=top - y0, height=bottom - top, src_y=piece['src_y'] + top - start))
+    return pieces
+
+def compose_rows(render_plan, canvas, image_width, y0, y1, load_image=None):
+    """取得长图 [y0, y1) 的像素，有画布时直接切片，否则按渲染计划拼接"""
+    if canvas is not None:
+        return canvas[y0:y1]
+    pieces = slice_render_plan(render_plan, y0, y1)
+    for _, band in iter_render_plan_bands(pieces, image_width, y1 - y0, y1 - y0, load_image):
+        return band
+    return np.zeros((0, image_width, 3), dtype=np.uint8)
+
+PAGE_BREAK_SEARCH_ROWS = 1024 # 在每页末尾多少行内寻找分页位置
+
+def find_page_breaks(render_plan, canvas, image_width, total_height, max_height, load_image=None):
+    """把长图分为不超过 max_height 的若干页，返回 [(y0, y1), ...]
+
+    分页位置取每页末尾一段内细节最少的行 (纯色背景)，同样平坦时优先截图接缝或删除处，其次取最靠下的行
+    """
+    seams = {piece['render_y_start'] for piece in render_plan}
+    pages = []
+    y0 = 0
+    while total_height - y0 > max_height:
+        hi = y0 + max_height
+        lo = max(y0 + 1, hi - min(PAGE_BREAK_SEARCH_ROWS, max_height // 4))
+        rows = compose_rows(render_plan, canvas, image_width, lo - 1, hi + 1, load_image)
+        gray = rows[:, ::2].astype(np.float32).mean(axis=2)
+        detail = np.abs(np.diff(gray, axis=1)).mean(axis=1)
+        change = np.abs(np.diff(gray, axis=0)).mean(axis=1)
+        # 第 k 个候选是 lo + k，即第 lo + k - 1 行与第 lo + k 行之间
+        scores = detail[:-1] + detail[1:] + change
+        flat = np.flatnonzero(scores <= scores.min() + 0.5) + lo
+        seam_breaks = [int(y) for y in flat if y in seams]
+        y1 = seam_breaks[-1] if seam_breaks else int(flat[-1])
+        pages.append((y0, y1))
+        y0 = y1
+    pages.append((y0, total_height))
+    return pages
+
+def composed_page_workers(image_width, page_height):
+    """整页合成时同时编码的页数，使各页缓冲区合计不超过可用内存的一半，无法获取可用内存时逐页编码"""
+    page_bytes = image_width * page_height * 3
+    available = SystemInteraction.get_available_memory()
+    if available is None:
+        return 1
+    workers = max(1, int(available * OUT_OF_CORE_MEMORY_RATIO // max(1, page_bytes)))
+    logging.debug(f"每页缓冲区 {page_bytes / 1024 / 1024:.0f} MB，可用内存 {available / 1024 / 1024:.0f} MB，最多同时编码 {workers} 页")
+    return workers
+
+def save_pages(output_file, pages, render_plan, canvas, image_width, save_format, load_image=None, progress_callback=None):
+    """把各页并行编码为带编号的文件，返回文件路径列表"""
+    digits = max(3, len(str(len(pages))))
+    page_files = [output_file.with_name(f"{output_file.stem}_{i + 1:0{digits}d}{output_file.suffix}") for i in range(len(pages))]
+    def save_page(page_file, y0, y1):
+        if save_format in ('JPEG', 'WEBP'):
+            rows = compose_rows(render_plan, canvas, image_width, y0, y1, load_image)
+            if not cv2.imwrite(str(page_file), rows, opencv_write_params(save_format)):
+                raise RuntimeError(f"无法将分页 {page_file} 写入磁盘")
+        elif save_format == 'TIFF':
+            bands = iter_region_bands(render_plan, canvas, image_width, y0, y1, StreamingTiledTIFFWriter.TILE_SIZE, load_image)
+            write_tiff_from_bands(page_file, image_width, y1 - y0, bands, threads=1)
+        else:
+            bands = iter_region_bands(render_plan, canvas, image_width, y0, y1, StreamingPNGWriter.BAND_HEIGHT, load_image)
+            write_png_from_bands(page_file, image_width, y1 - y0, bands, threads=1)
+    # 每页单线程编码，页与页之间并行
+    workers = output_thread_count()
+    if save_format in ('JPEG', 'WEBP') and canvas is None:
+        workers = min(workers, composed_page_workers(image_width, max(y1 - y0 for y0, y1 in pages)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PageEncoder") as executor:
+        futures = [executor.submit(save_page, page_file, y0, y1) for page_file, (y0, y1) in zip(page_files, pages)]
+        for i, future in enumerate(futures):
+            future.result()
+            if progress_callback:
+                progress_callback((i + 1) / len(futures))
+    return page_files
+
+class StreamingTiledTIFFWriter:
+    """按行带增量写出分块 (tiled) 的 8 位 RGB TIFF，下游工具可以只解码需要的区域
+
+    每个行带切成一行图块，以 Adobe Deflate 压缩 (可选水平差分预测)，各行带在线程池中并行压缩，
+    图块偏移表和 IFD 在结束时写在文件末尾
+    """
+    TILE_SIZE = 256
+    COMPRESSION_DEFLATE = 8
+    PREDICTOR_NONE = 1
+    PREDICTOR_HORIZONTAL = 2
+
+    def __init__(self, path, width, height, compression_level=6, predictor=PREDICTOR_HORIZONTAL, threads=1):
+        self.path = Path(path)
+        self.width = width
+        self.height = height
+        self.compression_level = compression_level
+        self.predictor = predictor
+        self.rows_written = 0
+        self.tiles_across = -(-width // self.TILE_SIZE)
+        self._tile_offsets = []
+        self._tile_byte_counts = []
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="TIFFEncoder") if threads > 1 else None
+        self._max_pending = max(1, threads) * 2
+        self._pending = collections.deque()
+        self._file = open(self.path, 'wb')
+        self._file.write(b'II*\x00\x00\x00\x00\x00') # IFD 偏移在结束时回填
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @classmethod
+    def encode_band(cls, band_bgr, tiles_across, compression_level, predictor):
+        """把一个行带补齐为整块后切成图块并逐块压缩，返回压缩数据列表"""
+        tile = cls.TILE_SIZE
+        padded = np.zeros((tile, tiles_across * tile, 3), dtype=np.uint8)
+        padded[:band_bgr.shape[0], :band_bgr.shape[1]] = band_bgr[:, :, ::-1]
+        tiles = padded.reshape(tile, tiles_across, tile, 3).transpose(1, 0, 2, 3)
+        if predictor == cls.PREDICTOR_HORIZONTAL:
+            diffed = tiles.copy()
+            np.subtract(tiles[:, :, 1:], tiles[:, :, :-1], out=diffed[:, :, 1:])
+            tiles = diffed
+        return [zlib.compress(np.ascontiguousarray(t), compression_level) for t in tiles]
+
+    def write_band(self, band_bgr):
+        """追加至多 TILE_SIZE 行 BGR 像素"""
+        self.rows_written += band_bgr.shape[0]
+        args = (band_bgr, self.tiles_across, self.compression_level, self.predictor)
+        if self._executor is None:
+            self._write_tiles(self.encode_band(*args))
+            return
+        # 行带可能是复用的缓冲区，交给线程池前先复制
+        self._pending.append(self._executor.submit(self.encode_band, band_bgr.copy(), *args[1:]))
+        while len(self._pending) >= self._max_pending or (self._pending and self._pending[0].done()):
+            self._write_tiles(self._pending.popleft().result())
+
+    def _write_tiles(self, tiles):
+        for data in tiles:
+            offset = self._file.tell()
+            if offset + len(data) >= 1 << 32:
+                raise RuntimeError("TIFF 文件超过 4 GB 上限")
+            self._tile_offsets.append(offset)
+            self._tile_byte_counts.append(len(data))
+            self._file.write(data)
+
+    def close(self):
+        try:
+            while self._pending:
+                self._write_tiles(self._pending.popleft().result())
+            if self.rows_written != self.height:
+                raise RuntimeError(f"TIFF 行数不完整: 已写入 {self.rows_written}/{self.height} 行")
+            self._write_ifd()
+        except BaseException:
+            self.abort()
+            raise
+        self._file.close()
+        self._shutdown_executor()
+
+    def abort(self):
+        """关闭并删除未写完的文件"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._shutdown_executor()
+        self._file.close()
+        self.path.unlink(missing_ok=True)
+
+    def _shutdown_executor(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _append_array(self, values, dtype):
+        if self._file.tell() % 2:
+            self._file.write(b'\x00')
+        offset = self._file.tell()
+        self._file.write(np.asarray(values, dtype=dtype).tobytes())
+        return offset
+
+    def _write_ifd(self):
+        SHORT, LONG = 3, 4
+        tile_count = len(self._tile_offsets)
+        bits_offset = self._append_array([8, 8, 8], '<u2')
+        offsets_offset = self._append_array(self._tile_offsets, '<u4') if tile_count > 1 else self._tile_offsets[0]
+        counts_offset = self._append_array(self._tile_byte_counts, '<u4') if tile_count > 1 else self._tile_byte_counts[0]
+        entries = [
+            (256, LONG, 1, self.width), # ImageWidth
+            (257, LONG, 1, self.height), # ImageLength
+            (258, SHORT, 3, bits_offset), # BitsPerSample
+            (259, SHORT, 1, self.COMPRESSION_DEFLATE), # Compression
+            (262, SHORT, 1, 2), # PhotometricInterpretation: RGB
+            (277, SHORT, 1, 3), # SamplesPerPixel
+            (284, SHORT, 1, 1), # PlanarConfiguration: 交错存储
+            (317, SHORT, 1, self.predictor), # Predictor
+            (322, SHORT, 1, self.TILE_SIZE), # TileWidth
+            (323, SHORT, 1, self.TILE_SIZE), # TileLength
+            (324, LONG, tile_count, offsets_offset), # TileOffsets
+            (325, LONG, tile_count, counts_offset), # TileByteCounts
+        ]
+        if self._file.tell() % 2:
+            self._file.write(b'\x00')
+        ifd_offset = self._file.tell()
+        if ifd_offset + 6 + 12 * len(entries) >= 1 << 32:
+            raise RuntimeError("TIFF 文件超过 4 GB 上限")
+        ifd = bytearray(struct.pack('<H', len(entries)))
+        for tag, field_type, count, value in entries:
+            value_bytes = struct.pack('<HH', value, 0) if field_type == SHORT and count == 1 else struct.pack('<I', value)
+            ifd += struct.pack('<HHI', tag, field_type, count) + value_bytes
+        ifd += struct.pack('<I', 0)
+        self._file.write(ifd)
+        self._file.seek(4)
+        self._file.write(struct.pack('<I', ifd_offset))
+
+def iter_region_bands(render_plan, canvas, image_width, y0, y1, band_height, load_image=None, progress_callback=None, threads=1):
+    """按行带遍历长图 [y0, y1) 的像素，有画布时直接切片，否则按渲染计划拼接"""
+    if canvas is not None:
+        return iter_canvas_bands(canvas[y0:y1], band_height, progress_callback)
+    return iter_render_plan_bands(slice_render_plan(render_plan, y0, y1), image_width, y1 - y0, band_height, load_image, progress_callback, threads)
+
+def write_tiff_from_bands(output_file, image_width, total_height, bands, threads=None):
+    """把按 TILE_SIZE 行产出的行带编码为分块 TIFF"""
+    preset = encode_preset()
+    threads = threads or output_thread_count()
+    logging.debug(f"TIFF 压缩级别: {preset['tiff_level']}，预测器: {preset['tiff_predictor']}，线程数: {threads}")
+    with StreamingTiledTIFFWriter(output_file, image_width, total_height, preset['tiff_level'], preset['tiff_predictor'], threads) as writer:
+        for _, band in bands:
+            writer.write_band(band)
+    return True
+
+DZI_VIEWER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>
+html, body { margin: 0; height: 100%; background: #2e3440; overflow: hidden; }
+#view { position: absolute; inset: 0; overflow: auto; }
+#canvas { position: relative; margin: 0 auto; }
+#canvas img { position: absolute; display: block; }
+#zoom { position: fixed; right: 16px; top: 12px; padding: 4px 8px; border-radius: 4px; color: #eceff4; background: rgba(46, 52, 64, 0.8); font: 13px sans-serif; }
+</style>
+</head>
+<body>
+<div id="view"><div id="canvas"></div></div>
+<div id="zoom" title="Ctrl+滚轮 或 +/- 缩放，0 适应宽度"></div>
+<script>
+const INFO = __INFO__;
+const view = document.getElementById('view');
+const canvas = document.getElementById('canvas');
+const zoomLabel = document.getElementById('zoom');
+const tiles = new Map();
+const fitScale = () => Math.min(1, view.clientWidth / INFO.width);
+let scale = fitScale();
+
+function layout() {
+  canvas.style.width = Math.ceil(INFO.width * scale) + 'px';
+  canvas.style.height = Math.ceil(INFO.height * scale) + 'px';
+  zoomLabel.textContent = Math.round(scale * 100) + '%';
+  for (const img of tiles.values()) img.remove();
+  tiles.clear();
+}
+
+function update() {
+  // 选择像素密度不低于屏幕显示密度的最低级别，只加载视口附近的瓦片
+  const wanted = Math.ceil(Math.log2(scale * window.devicePixelRatio));
+  const level = Math.max(0, Math.min(INFO.maxLevel, INFO.maxLevel + wanted));
+  const levelScale = Math.pow(2, level - INFO.maxLevel);
+  const size = INFO.tileSize / levelScale * scale;
+  const cols = Math.ceil(Math.ceil(INFO.width * levelScale) / INFO.tileSize);
+  const rows = Math.ceil(Math.ceil(INFO.height * levelScale) / INFO.tileSize);
+  const left = view.scrollLeft - canvas.offsetLeft;
+  const c0 = Math.max(0, Math.floor(left / size) - 1);
+  const c1 = Math.min(cols - 1, Math.floor((left + view.clientWidth) / size) + 1);
+  const r0 = Math.max(0, Math.floor(view.scrollTop / size) - 1);
+  const r1 = Math.min(rows - 1, Math.floor((view.scrollTop + view.clientHeight) / size) + 1);
+  const visible = new Set();
+  for (let r = r0; r <= r1; r++) {
+    for (let c = c0; c <= c1; c++) {
+      const key = level + '/' + c + '_' + r;
+      visible.add(key);
+      if (tiles.has(key)) continue;
+      const img = new Image();
+      img.onload = () => { img.style.width = img.naturalWidth / levelScale * scale + 'px'; };
+      img.style.left = c * size + 'px';
+      img.style.top = r * size + 'px';
+      img.src = encodeURI(INFO.tilesUrl + key + '.' + INFO.format);
+      canvas.appendChild(img);
+      tiles.set(key, img);
+    }
+  }
+  for (const [key, img] of tiles) {
+    if (!visible.has(key)) { img.remove(); tiles.delete(key); }
+  }
+}
+
+function zoomTo(newScale, x, y) {
+  newScale = Math.max(fitScale() / 8, Math.min(4, newScale));
+  const imageX = (view.scrollLeft + x - canvas.offsetLeft) / scale;
+  const imageY = (view.scrollTop + y) / scale;
+  scale = newScale;
+  layout();
+  view.scrollLeft = imageX * scale + canvas.offsetLeft - x;
+  view.scrollTop = imageY * scale - y;
+  update();
+}
+
+view.addEventListener('wheel', (e) => {
+  if (!e.ctrlKey) return;
+  e.preventDefault();
+  zoomTo(scale * (e.deltaY < 0 ? 1.25 : 0.8), e.clientX, e.clientY);
+}, { passive: false });
+document.addEventListener('keydown', (e) => {
+  const x = view.clientWidth / 2, y = view.clientHeight / 2;
+  if (e.key === '+' || e.key === '=') zoomTo(scale * 1.25, x, y);
+  else if (e.key === '-') zoomTo(scale * 0.8, x, y);
+  else if (e.key === '0') zoomTo(fitScale(), x, y);
+});
+view.addEventListener('scroll', update);
+window.addEventListener('resize', update);
+layout();
+update();
+</script>
+</body>
+</html>
+"""
+
+class DeepZoomWriter:
+    """按行带生成 Deep Zoom (DZI) 瓦片金字塔，并写出一个不依赖网络的 HTML 查看器
+
+    每行瓦片写出后缩小一半送往下一级，各级只缓存不足一行瓦片的像素，瓦片在线程池中并行编码
+    """
+    TILE_SIZE = 256
+    TILE_FORMAT = 'png'
+    PNG_COMPRESSION = 3
+
+    def __init__(self, path, width, height, threads=1):
+        self.path = Path(path)
+        self.viewer_path = self.path.with_suffix('.html')
+        self.tiles_dir = self.tiles_directory(self.path)
+        self.width = width
+        self.height = height
+        self.max_level = math.ceil(math.log2(max(width, height, 1)))
+        self.rows_written = 0
+        self.tile_count = 0
+        self.total_bytes = 0
+        levels = range(self.max_level + 1)
+        self._buffers = {level: [] for level in levels}
+        self._buffered_rows = dict.fromkeys(levels, 0)
+        self._tile_rows = dict.fromkeys(levels, 0)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="DZIEncoder")
+        self._max_pending = max(1, threads) * 16
+        self._pending = collections.deque()
+        for level in levels:
+            (self.tiles_dir / str(level)).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def tiles_directory(path):
+        return Path(path).with_name(f"{Path(path).stem}_files")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def write_band(self, band_bgr):
+        """追加若干行全分辨率 BGR 像素"""
+        self.rows_written += band_bgr.shape[0]
+        self._feed(self.max_level, band_bgr)
+
+    def _feed(self, level, rows=None, final=False):
+        tile = self.TILE_SIZE
+        if rows is not None and rows.shape[0]:
+            # 行带可能是复用的缓冲区，缓存前先复制
+            self._buffers[level].append(rows.copy())
+            self._buffered_rows[level] += rows.shape[0]
+        while self._buffered_rows[level] >= tile or (final and self._buffered_rows[level]):
+            buffered = self._buffers[level]
+            pixels = buffered[0] if len(buffered) == 1 else np.concatenate(buffered)
+            tile_row, rest = pixels[:tile], pixels[tile:]
+            self._buffers[level] = [rest] if rest.shape[0] else []
+            self._buffered_rows[level] = rest.shape[0]
+            self._write_tile_row(level, tile_row)
+            if level > 0:
+                h, w = tile_row.shape[:2]
+                self._feed(level - 1, cv2.resize(tile_row, (-(-w // 2), -(-h // 2)), interpolation=cv2.INTER_AREA))
+        if final and level > 0:
+            self._feed(level - 1, final=True)
+
+    def _write_tile_row(self, level, rows):
+        tile = self.TILE_SIZE
+        row_index = self._tile_rows[level]
+        self._tile_rows[level] += 1
+        for col, x in enumerate(range(0, rows.shape[1], tile)):
+            tile_path = self.tiles_dir / str(level) / f"{col}_{row_index}.{self.TILE_FORMAT}"
+            self._pending.append(self._executor.submit(self._encode_tile, tile_path, rows[:, x:x + tile]))
+        while len(self._pending) > self._max_pending or (self._pending and self._pending[0].done()):
+            self._collect(self._pending.popleft())
+
+    @classmethod
+    def _encode_tile(cls, tile_path, tile_bgr):
+        ok, data = cv2.imencode(f'.{cls.TILE_FORMAT}', np.ascontiguousarray(tile_bgr), [int(cv2.IMWRITE_PNG_COMPRESSION), cls.PNG_COMPRESSION])
+        if not ok:
+            raise RuntimeError(f"无法编码瓦片 {tile_path}")
+        tile_path.write_bytes(data)
+        return len(data)
+
+    def _collect(self, future):
+        self.total_bytes += future.result()
+        self.tile_count += 1
+
+    def close(self):
+        """写完剩余瓦片、描述文件和查看器，返回查看器路径"""
+        try:
+            if self.rows_written != self.height:
+                raise RuntimeError(f"DZI 行数不完整: 已写入 {self.rows_written}/{self.height} 行")
+            self._feed(self.max_level, final=True)
+            while self._pending:
+                self._collect(self._pending.popleft())
+            self.path.write_text(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{self.TILE_FORMAT}" Overlap="0" TileSize="{self.TILE_SIZE}">\n'
+                f'  <Size Width="{self.width}" Height="{self.height}"/>\n'
+                '</Image>\n', encoding='utf-8')
+            self.viewer_path.write_text(self._viewer_html(), encoding='utf-8')
+        except BaseException:
+            self.abort()
+            raise
+        self._executor.shutdown(wait=True)
+        return self.viewer_path
+
+    def abort(self):
+        """停止编码并删除已写出的瓦片和文件"""
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+        shutil.rmtree(self.tiles_dir, ignore_errors=True)
+        self.path.unlink(missing_ok=True)
+        self.viewer_path.unlink(missing_ok=True)
+
+    def _viewer_html(self):
+        info = {
+            'width': self.width, 'height': self.height, 'tileSize': self.TILE_SIZE, 'maxLevel': self.max_level,
+            'format': self.TILE_FORMAT, 'tilesUrl': f"{self.tiles_dir.name}/",
+        }
+        # 转义 "<" 以免文件名中的 "</script>" 提前结束脚本
+        info_json = json.dumps(info, ensure_ascii=False).replace('<', '\\u003c')
+        return DZI_VIEWER_TEMPLATE.replace('__TITLE__', html.escape(self.path.stem)).replace('__INFO__', info_json)
+
+def write_dzi(output_file, render_plan, canvas, image_width, total_height, load_image=None, progress_callback=None):
+    """直接由渲染计划 (或增量画布) 生成 DZI 瓦片金字塔，返回 HTML 查看器路径"""
+    threads = output_thread_count()
+    logging.debug(f"以 DZI 瓦片金字塔保存，线程数: {threads}")
+    bands = iter_region_bands(render_plan, canvas, image_width, 0, total_height, DeepZoomWriter.TILE_SIZE, load_image, progress_callback, threads)
+    with DeepZoomWriter(output_file, image_width, total_height, threads) as writer:
+        for _, band in bands:
+            writer.write_band(band)
+    logging.info(f"DZI 共 {writer.max_level + 1} 级 {writer.tile_count} 个瓦片，{writer.total_bytes / 1024 / 1024:.2f} MB")
+    return writer.viewer_path
+
+PDF_POINTS_PER_PIXEL = 0.75 # 按 96 DPI 把像素换算为 PDF 点
+PDF_MAX_PAGE_POINTS = 14400 # PDF 阅读器普遍支持的最大页面边长
+PDF_CANVAS_BAND_ROWS = 1024 # 从画布绘制时每张嵌入图片的行数
+
+def pdf_page_height(image_width):
+    """PDF 每页的最大高度 (px)：优先使用分页高度，否则按 A 系列纸张比例，且不超过 PDF 页面上限"""
+    page_height = config.PAGE_MAX_HEIGHT if config.PAGE_MAX_HEIGHT > 0 else round(image_width * math.sqrt(2))
+    return max(1, min(page_height, int(PDF_MAX_PAGE_POINTS / PDF_POINTS_PER_PIXEL)))
+
+def _paint_bgr_rows(cr, rows, dest_y):
+    """把 BGR 行绘制到 cairo 上下文的 dest_y 处，返回的图片面需保留到该页输出之后"""
+    if rows.shape[0] == 0:
+        return None
+    bgra = cv2.cvtColor(np.ascontiguousarray(rows), cv2.COLOR_BGR2BGRA)
+    surface = cairo.ImageSurface.create_for_data(bgra, cairo.FORMAT_RGB24, bgra.shape[1], bgra.shape[0], bgra.strides[0])
+    cr.set_source_surface(surface, 0, dest_y)
+    cr.rectangle(0, dest_y, bgra.shape[1], bgra.shape[0])
+    cr.fill()
+    return surface, bgra
+
+def write_pdf(output_file, pages, render_plan, canvas, image_width, load_image=None, progress_callback=None):
+    """以 cairo PDFSurface 逐页写出多页 PDF，每页直接由渲染计划的片段 (或增量画布) 绘制"""
+    scale = PDF_POINTS_PER_PIXEL
+    surface = cairo.PDFSurface(str(output_file), image_width * scale, (pages[0][1] - pages[0][0]) * scale)
+    if hasattr(cairo, 'PDFMetadata'): # pycairo 1.16 起才支持设置元数据
+        surface.set_metadata(cairo.PDFMetadata.CREATOR, "Scroll Stitch")
+    cr = cairo.Context(surface)
+    frames = None
+    if canvas is None:
+        frames = iter_decoded_frames(list(dict.fromkeys(piece['filepath'] for piece in render_plan)), load_image, output_thread_count())
+    current_img_path = current_img = None
+    try:
+        for page_index, (y0, y1) in enumerate(pages):
+            surface.set_size(image_width * scale, (y1 - y0) * scale)
+            # PDF 在 show_page 时才写出本页引用的图片数据
+            page_sources = []
+            cr.save()
+            cr.scale(scale, scale)
+            if canvas is not None:
+                for band_y in range(y0, y1, PDF_CANVAS_BAND_ROWS):
+                    page_sources.append(_paint_bgr_rows(cr, canvas[band_y:min(band_y + PDF_CANVAS_BAND_ROWS, y1)], band_y - y0))
+            else:
+                for piece in slice_render_plan(render_plan, y0, y1):
+                    if piece['filepath'] != current_img_path:
+                        current_img_path, current_img = next(frames)
+                    if current_img is not None:
+                        src_y = piece['src_y']
+                        page_sources.append(_paint_bgr_rows(cr, current_img[src_y:src_y + piece['height'], :image_width], piece['render_y_start']))
+            cr.restore()
+            cr.show_page()
+            page_sources.clear()
+            if progress_callback:
+                progress_callback((page_index + 1) / len(pages))
+    except BaseException:
+        # 删除未写完的文件
+        surface.finish()
+        Path(output_file).unlink(missing_ok=True)
+        raise
+    finally:
+        surface.finish()
+        if frames is not None:
+            frames.close()
+    return True
 # 缓冲区px }
 
+class CompressedFrameStore:
+    """以 zlib 快速压缩保存在内存中的已解码帧，介于预览缓存和磁盘上的 PNG 之间"""
+    def __init__(self, byte_budget):
+        self.byte_budget = byte_budget
+        self.nbytes = 0
+        self.raw_nbytes = 0
+        self.stats = Counter() # hits, misses, evictions
+        self._frames = collections.OrderedDict() # filepath -> (压缩数据, shape, 原始字节数)
+        self._generations = {} # filepath -> 被移除的次数，丢弃移除前提交的压缩结果
+        self._lock = threading.Lock()
+        self._pending = queue.Queue()
+        self._thread = None
+        if self.byte_budget > 0:
+            self._thread = threading.Thread(target=self._compress_loop, daemon=True, name="FrameCompressor")
+            self._thread.start()
+
+    def submit(self, filepath, array):
+        """在后台压缩并保存一帧，已保存或未启用时忽略"""
+        if self._thread is None or array is None:
+            return
+        with self._lock:
+            if filepath in self._frames:
+                return
+            generation = self._generations.get(filepath, 0)
+        self._pending.put((filepath, array, generation))
+
+    def _compress_loop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            filepath, array, generation = item
+            try:
+                data = zlib.compress(np.ascontiguousarray(array), 1)
+            except Exception as e:
+                logging.warning(f"压缩帧失败 {filepath}: {e}")
+                continue
+            with self._lock:
+                if filepath in self._frames or self._generations.get(filepath, 0) != generation:
+                    continue
+                self._frames[filepath] = (data, array.shape, array.nbytes)
+                self.nbytes += len(data)
+                self.raw_nbytes += array.nbytes
+                while self.nbytes > self.byte_budget and len(self._frames) > 1:
+                    _, (old_data, _, old_raw) = self._frames.popitem(last=False)
+                    self.nbytes -= len(old_data)
+                    self.raw_nbytes -= old_raw
+                    self.stats['evictions'] += 1
+
+    def get(self, filepath):
+        """返回解压后的可写数组，不存在时返回 None"""
+        with self._lock:
+            frame = self._frames.get(filepath)
+            if frame is None:
+                self.stats['misses'] += 1
+                return None
+            self._frames.move_to_end(filepath)
+            self.stats['hits'] += 1
+        data, shape, _ = frame
+        return np.frombuffer(bytearray(zlib.decompress(data)), dtype=np.uint8).reshape(shape)
+
+    def __contains__(self, filepath):
+        with self._lock:
+            return filepath in self._frames
+
+    def remove(self, filepath):
+        with self._lock:
+            self._generations[filepath] = self._generations.get(filepath, 0) + 1
+            frame = self._frames.pop(filepath, None)
+            if frame is not None:
+                self.nbytes -= len(frame[0])
+                self.raw_nbytes -= frame[2]
+
+    def report(self) -> str:
+        ratio = self.nbytes / self.raw_nbytes * 100 if self.raw_nbytes else 0.0
+        return (f"{len(self._frames)} 张, {self.nbytes / 1024 / 1024:.1f}/{self.byte_budget / 1024 / 1024:.0f} MB (原始大小的 {ratio:.0f}%), "
+                f"命中 {self.stats['hits']} 次, 未命中 {self.stats['misses']} 次, 淘汰 {self.stats['evictions']} 张")
+
+    def close(self):
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join(timeout=0.5)
+            self._thread = None
+
+class ModificationIndex:
+    """删除区域和恢复接缝的索引，按单个修改增量更新，查询均为二分查找"""
+    # 缓冲区px
+    def __init__(self, modifications=()):
+        self._raw_deletes = [] # 按起点排序的原始删除区域，允许重复
+        self.merged_starts = [] # 合并后互不重叠的删除区域
+        self.merged_ends = []
+        self._restore_counts = Counter()
+        for mod in modifications:
+            self.apply(mod)
+
+    @property
+    def merged_regions(self):
+        return list(zip(self.merged_starts, self.merged_ends))
+
+    def apply(self, mod):
+        if mod['type'] == 'restore':
+            self._restore_counts[mod['seam_index']] += 1
+        elif mod['type'] == 'delete':
+            self._add_delete(mod['y_start_abs'], mod['y_end_abs'])
+
+    def revert(self, mod):
+        if mod['type'] == 'restore':
+            seam_index = mod['seam_index']
+            self._restore_counts[seam_index] -= 1
+            if self._restore_counts[seam_index] <= 0:
+                del self._restore_counts[seam_index]
+        elif mod['type'] == 'delete':
+            self._remove_delete(mod['y_start_abs'], mod['y_end_abs'])
+
+    def _add_delete(self, start, end):
+        bisect.insort(self._raw_deletes, (start, end))
+        lo = bisect.bisect_left(self.merged_ends, start)
+        hi = bisect.bisect_right(self.merged_starts, end)
+        if lo < hi:
+            start = min(start, self.merged_starts[lo])
+            end = max(end, self.merged_ends[hi - 1])
+        self.merged_starts[lo:hi] = [start]
+        self.merged_ends[lo:hi] = [end]
+
+    def _remove_delete(self, start, end):
+        raw_index = bisect.bisect_left(self._raw_deletes, (start, end))
+        if raw_index >= len(self._raw_deletes) or self._raw_deletes[raw_index] != (start, end):
+            logging.warning(f"ModificationIndex: 未找到要移除的删除区域 [{start}, {end})")
+            return
+        del self._raw_deletes[raw_index]
+        region_index = bisect.bisect_right(self.merged_starts, start) - 1
+        region_start, region_end = self.merged_starts[region_index], self.merged_ends[region_index]
+        # 只需重新合并原先属于该区域的原始删除区域
+        raw_lo = bisect.bisect_left(self._raw_deletes, (region_start, float('-inf')))
+        raw_hi = bisect.bisect_right(self._raw_deletes, (region_end, float('inf')))
+        new_starts, new_ends = [], []
+        for raw_start, raw_end in self._raw_deletes[raw_lo:raw_hi]:
+            if new_starts and raw_start <= new_ends[-1]:
+                new_ends[-1] = max(new_ends[-1], raw_end)
+            else:
+                new_starts.append(raw_start)
+                new_ends.append(raw_end)
+        self.merged_starts[region_index:region_index + 1] = new_starts
+        self.merged_ends[region_index:region_index + 1] = new_ends
+
+    def is_restored(self, seam_index):
+        return seam_index in self._restore_counts
+
+    def is_deleted(self, y):
+        index = bisect.bisect_right(self.merged_starts, y) - 1
+        return index >= 0 and y < self.merged_ends[index]
+
+    def overlaps(self, start, end):
+        """[start, end) 是否与任一删除区域相交"""
+        index = bisect.bisect_right(self.merged_ends, start)
+        return index < len(self.merged_starts) and self.merged_starts[index] < end
+
+    def first_region_index(self, y):
+        """返回第一个可能覆盖 y 或位于 y 之后的合并区域下标"""
+        return bisect.bisect_right(self.merged_ends, y)
+
+class RenderPlan:
+    """渲染层的列式存储，每个字段是一列 int64 数组，按下标取出时仍返回与原先相同的字典"""
+    # 缓冲区px
+    FIELDS = ('entry_index', 'absolute_y_start', 'absolute_y_end', 'render_y_start', 'height', 'src_y')
+    __slots__ = ('_columns', '_size', 'filepaths')
+
+    def __init__(self, capacity=64):
+        self._columns = {name: np.zeros(capacity, dtype=np.int64) for name in self.FIELDS}
+        self._size = 0
+        self.filepaths = []
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("RenderPlan 下标越界")
+        piece = {name: int(column[index]) for name, column in self._columns.items()}
+        piece['filepath'] = self.filepaths[index]
+        return piece
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def column(self, name):
+        """返回某一列有效部分的视图，不复制数据"""
+        return self._columns[name][:self._size]
+
+    def append(self, entry_index, filepath, absolute_y_start, absolute_y_end, render_y_start, height, src_y):
+        if self._size == len(self._columns['height']):
+            for name, column in self._columns.items():
+                grown = np.zeros(max(64, len(column) * 2), dtype=np.int64)
+                grown[:self._size] = column[:self._size]
+                self._columns[name] = grown
+        i = self._size
+        cols = self._columns
+        cols['entry_index'][i] = entry_index
+        cols['absolute_y_start'][i] = absolute_y_start
+        cols['absolute_y_end'][i] = absolute_y_end
+        cols['render_y_start'][i] = render_y_start
+        cols['height'][i] = height
+        cols['src_y'][i] = src_y
+        self.filepaths.append(filepath)
+        self._size += 1
+
+    def truncate(self, size):
+        size = max(0, min(size, self._size))
+        del self.filepaths[size:]
+        self._size = size
+
+    def splice(self, start, stop, other, render_delta):
+        """用 other 替换 [start, stop) 的片段，并把之后片段的 render_y_start 平移 render_delta"""
+        stop = min(stop, self._size)
+        tail_size = self._size - stop
+        new_size = start + len(other) + tail_size
+        for name, column in self._columns.items():
+            tail = column[stop:self._size].copy()
+            if name == 'render_y_start':
+                tail += render_delta
+            if new_size > len(column):
+                grown = np.zeros(max(64, new_size * 2), dtype=np.int64)
+                grown[:start] = column[:start]
+                column = grown
+                self._columns[name] = column
+            column[start:start + len(other)] = other.column(name)
+            column[start + len(other):new_size] = tail
+        self.filepaths[start:stop] = other.filepaths
+        self._size = new_size
+
+    def index_at_render_y(self, render_y):
+        """返回 render_y 所在(或之前最近)的片段下标"""
+        return max(0, int(np.searchsorted(self.column('render_y_start'), render_y, side='right')) - 1)
+
+class IncrementalComposite:
+    """截图过程中在后台维护的磁盘映射长图画布，完成时无需再逐张读取截图
+
+    主线程只按渲染层的变化顺序投递操作，由后台线程重新合成受影响的行，
+    其后未变化的行在文件内整体平移。空闲时把最近几张截图之上不会再变化的行带
+    预先编码为 PNG 压缩块，完成时只需编码剩余的末尾部分
+    """
+    GROW_ROWS = 4096
+    MOVE_ROWS = 1024
+    IMAGE_CACHE_SIZE = 2
+
+    def __init__(self, path, load_image=None):
+        self.path = Path(path)
+        self.load_image = load_image
+        self.width = 0
+        self.height = 0
+        self.capacity = 0
+        self.failed = False
+        self.stable_height = 0 # 此高度之上的行预计不再变化，可以预编码
+        self.encoded_blocks = [] # 从顶部开始连续的已预编码行带 (压缩块, adler32, 字节数)
+        self._encoding_enabled = True
+        self._canvas = None
+        self._images = collections.OrderedDict() # filepath -> 已解码的 BGR 图片
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._build_loop, daemon=True, name="CompositeBuilder")
+        self._thread.start()
+
+    def replace(self, render_y, old_height, pieces, width, total_height, stable_height=0):
+        """用 pieces 替换 [render_y, render_y + old_height) 的行，其后的行随之平移"""
+        self._queue.put(('replace', render_y, old_height, pieces, width, total_height, stable_height))
+
+    def resize(self, total_height):
+        """截断到 total_height 行"""
+        self._queue.put(('resize', total_height))
+
+    def finish(self, total_height):
+        """停止预编码并等待所有操作完成，返回画布视图，失败或高度不一致时返回 None"""
+        self._queue.put(('finish',))
+        self._queue.join()
+        if self.failed or self._canvas is None or self.height != total_height:
+            logging.warning(f"增量画布不可用 (失败: {self.failed}, 高度: {self.height}/{total_height})")
+            return None
+        return self._canvas[:total_height]
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=1.0)
+        self._canvas = None
+        self._images.clear()
+        self.path.unlink(missing_ok=True)
+
+    def _build_loop(self):
+        while True:
+            if self._encoding_enabled and not self.failed and self._encode_next_band():
+                continue
+            op = self._queue.get()
+            try:
+                if op is None:
+                    break
+                if op[0] == 'finish':
+                    self._encoding_enabled = False
+                elif not self.failed:
+                    if op[0] == 'replace':
+                        self._apply_replace(*op[1:])
+                    else:
+                        self.height = min(self.height, op[1])
+                        self._invalidate_encoded(self.height)
+            except Exception as e:
+                logging.error(f"增量画布更新失败，完成时将改为重新拼接: {e}")
+                self.failed = True
+                self._canvas = None
+            finally:
+                self._queue.task_done()
+
+    def _invalidate_encoded(self, y):
+        """第 y 行起发生变化，丢弃依赖这些行的预编码块 (每块还依赖上一行带的末尾)"""
+        del self.encoded_blocks[y // StreamingPNGWriter.BAND_HEIGHT:]
+
+    def _encode_next_band(self):
+        """队列为空时预编码下一个稳定的行带，没有可做的工作时返回 False"""
+        if not self._queue.empty():
+            return False
+        band_height = StreamingPNGWriter.BAND_HEIGHT
+        band_y = len(self.encoded_blocks) * band_height
+        if band_y + band_height > min(self.stable_height, self.height):
+            return False
+        try:
+            prev_row, prev_tail = StreamingPNGWriter.state_before(self._canvas, band_y, band_height)
+            self.encoded_blocks.append(StreamingPNGWriter.encode_band(self._canvas[band_y:band_y + band_height], prev_row, prev_tail))
+        except Exception as e:
+            logging.warning(f"预编码行带失败，将在完成时重新编码: {e}")
+            self._encoding_enabled = False
+            return False
+        return True
+
+    def _apply_replace(self, render_y, old_height, pieces, width, total_height, stable_height):
+        if width != self.width:
+            # 只有在所有已有行都被替换时(例如全部撤销后重新截图)才允许改变宽度
+            if render_y > 0 or render_y + old_height < self.height:
+                raise ValueError(f"截图宽度由 {self.width} 变为 {width}")
+            self.width = width
+            self.height = old_height = 0
+            self.capacity = 0
+            self._canvas = None
+        self._invalidate_encoded(render_y)
+        self.stable_height = stable_height
+        new_height = sum(piece['height'] for piece in pieces)
+        delta = new_height - old_height
+        self._ensure_capacity(max(total_height, self.height + delta))
+        self._move_rows(render_y + old_height, self.height, delta)
+        self.height = total_height
+        for piece in pieces:
+            dest_y = piece['render_y_start']
+            img = self._get_image(piece['filepath'])
+            copy_h = 0
+            if img is not None:
+                copy_h = max(0, min(piece['height'], img.shape[0] - piece['src_y']))
+                copy_w = min(self.width, img.shape[1])
+                self._canvas[dest_y:dest_y + copy_h, :copy_w] = img[piece['src_y']:piece['src_y'] + copy_h, :copy_w]
+                self._canvas[dest_y:dest_y + copy_h, copy_w:] = 0
+            self._canvas[dest_y + copy_h:dest_y + piece['height']] = 0
+
+    def _get_image(self, filepath):
+        if filepath in self._images:
+            self._images.move_to_end(filepath)
+            return self._images[filepath]
+        img = self.load_image(filepath) if self.load_image else None
+        if img is None:
+            if not Path(filepath).exists():
+                # 排队期间截图已被撤销并删除，这些行会被随后的 replace 覆盖
+                logging.debug(f"增量合成跳过已删除的截图 {filepath}")
+                return None
+            img = _decode_frame(filepath)
+        self._images[filepath] = img
+        while len(self._images) > self.IMAGE_CACHE_SIZE:
+            self._images.popitem(last=False)
+        return img
+
+    def _ensure_capacity(self, rows):
+        if rows <= self.capacity:
+            return
+        new_capacity = max(rows, self.capacity * 2, self.GROW_ROWS)
+        if self._canvas is not None:
+            self._canvas.flush()
+            self._canvas = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.truncate(new_capacity * self.width * 3)
+        self._canvas = np.memmap(self.path, dtype=np.uint8, mode='r+', shape=(new_capacity, self.width, 3))
+        self.capacity = new_capacity
+
+    def _move_rows(self, start, end, delta):
+        """把 [start, end) 行整体平移 delta 行，分块复制以免产生整段临时副本"""
+        if delta == 0 or start >= end:
+            return
+        step = self.MOVE_ROWS
+        if delta > 0:
+            for y1 in range(end, start, -step):
+                y0 = max(start, y1 - step)
+                self._canvas[y0 + delta:y1 + delta] = self._canvas[y0:y1]
+        else:
+            for y0 in range(start, end, step):
+                y1 = min(end, y0 + step)
+                self._canvas[y0 + delta:y1 + delta] = self._canvas[y0:y1]
+
 class StitchModel(GObject.Object):
     """管理拼接数据的模型，支持异步更新和信号通知"""
     # 缓冲区px
@@ -2119,159 +3447,343 @@ class StitchModel(GObject.Object):
         'modification-stack-changed': (GObject.SignalFlags.RUN_FIRST, None, ()),
         'image-ready': (GObject.SignalFlags.RUN_FIRST, None, (str, object)),
     }
+    MIP_LEVELS = (2, 4, 8) # 预览缩小时使用的降采样级别
+    UNSTABLE_ENTRIES = 3 # 最近几张截图对应的行仍可能因新截图或撤销而变化，不做预编码
     def __init__(self):
         super().__init__()
         self.entries = []
         self.image_width = 0
         self.total_virtual_height = 0
+        self._dirty_render_span = None # 自上次取出后渲染层发生变化的范围，结束为 None 表示直到末尾
         self.modifications = []
         self.redo_stack = []
-        self.render_plan = [] # 渲染层
-        self.merged_del_regions = []
+        self.render_plan = RenderPlan() # 渲染层
+        self.modification_index = ModificationIndex()
+        self._entry_abs_starts = []
+        self._entry_reach_max = [] # 前 i+1 个条目有效范围末端的最大值
+        self._entry_overhang_max = [] # 前 i+1 个条目 crop_top 向上超出自身的最大量
         self.surface_cache = collections.OrderedDict()
         self.CACHE_SIZE = config.PREVIEW_CACHE_SIZE
-        self._load_queue = []
-        self._loading_set = set()
+        self.cache_byte_budget = config.PREVIEW_CACHE_MEMORY_MB * 1024 * 1024
+        self.cache_bytes = 0
+        self.cache_stats = Counter() # hits, misses, evictions
+        self.frame_store = CompressedFrameStore(config.PREVIEW_COMPRESSED_CACHE_MB * 1024 * 1024)
+        self.composite = IncrementalComposite(config.TEMP_DIRECTORY / "composite.rgb", self.load_frame_bgr) if config.INCREMENTAL_COMPOSITE else None
+        self._load_heap = [] # (优先级, 序号, filepath)，过期的条目在弹出时跳过
+        self._queued_priorities = {} # 排队中的 filepath -> 当前优先级
+        self._loading_set = set() # 排队中和加载中的 filepath，用于去重
         self._roi_filepaths = set()
+        self._roi_priorities = {}
+        self._mip_sources = {} # 生成降采样图时可直接使用的已解码全图
+        self._load_seq = 0
         self._queue_lock = threading.Lock()
         self._worker_condition = threading.Condition(self._queue_lock)
         self._worker_running = True
-        self._loader_thread = threading.Thread(target=self._image_loader_worker, daemon=True, name="ImageLoader")
-        self._loader_thread.start()
+        self._loader_threads = []
+        for i in range(max(1, config.PREVIEW_LOADER_THREADS)):
+            thread = threading.Thread(target=self._image_loader_worker, daemon=True, name=f"ImageLoader-{i}")
+            thread.start()
+            self._loader_threads.append(thread)
 
     @property
     def capture_count(self) -> int:
         return len(self.entries)
 
-    def update_roi(self, roi_set):
+    @staticmethod
+    def _cache_key(filepath, level=1):
+        """全图以 filepath 为键，降采样图以 (filepath, level) 为键"""
+        return filepath if level == 1 else (filepath, level)
+
+    @staticmethod
+    def _key_filepath(key):
+        return key[0] if isinstance(key, tuple) else key
+
+    def _push_load_locked(self, key):
+        priority = self._roi_priorities.get(self._key_filepath(key), (float('inf'),))
+        self._queued_priorities[key] = priority
+        self._load_seq += 1
+        heapq.heappush(self._load_heap, (priority, self._load_seq, key))
+
+    def update_roi(self, roi_set, priorities=None):
+        """更新需要加载的图片集合及其优先级，队列中已不需要的请求直接取消"""
         with self._queue_lock:
             self._roi_filepaths = roi_set
-
-    def request_image(self, filepath):
-        if filepath in self.surface_cache:
-            self.surface_cache.move_to_end(filepath)
-            return self.surface_cache[filepath]
+            self._roi_priorities = priorities or {}
+            queued = list(self._queued_priorities)
+            self._load_heap.clear()
+            self._queued_priorities.clear()
+            for key in queued:
+                if self._key_filepath(key) in roi_set:
+                    self._push_load_locked(key)
+                else:
+                    self._loading_set.discard(key)
+                    self._mip_sources.pop(key, None)
+
+    def peek_image(self, filepath):
+        """只查询缓存中的全图，不触发加载"""
+        return self.surface_cache.get(filepath)
+
+    def request_image(self, filepath, level=1):
+        key = self._cache_key(filepath, level)
+        if key in self.surface_cache:
+            self.cache_stats['hits'] += 1
+            self.surface_cache.move_to_end(key)
+            return self.surface_cache[key]
         with self._queue_lock:
-            if filepath in self._loading_set:
+            if key in self._loading_set:
                 return None
-            self._loading_set.add(filepath)
-            self._load_queue.append(filepath)
+            # 加载期间的重绘不再计入未命中，每次排队加载只记一次
+            self.cache_stats['misses'] += 1
+            self._loading_set.add(key)
+            full_bundle = self.surface_cache.get(filepath) if level > 1 else None
+            if full_bundle is not None:
+                self._mip_sources[key] = full_bundle[1]
+            self._push_load_locked(key)
             self._worker_condition.notify()
         return None
 
     def _image_loader_worker(self):
         while True:
-            filepath_to_load = None
             with self._worker_condition:
-                while not self._load_queue and self._worker_running:
+                while not self._load_heap and self._worker_running:
                     self._worker_condition.wait()
                 if not self._worker_running:
                     break
-                candidate = self._load_queue.pop()
-                is_needed = candidate in self._roi_filepaths
-                if is_needed:
-                    filepath_to_load = candidate
-                else:
-                    if candidate in self._loading_set:
-                        self._loading_set.remove(candidate)
+                priority, _, candidate = heapq.heappop(self._load_heap)
+                if self._queued_priorities.get(candidate) != priority:
                     continue
-            if filepath_to_load:
-                if not os.path.exists(filepath_to_load):
-                    GLib.idle_add(self._on_image_loaded_ui, filepath_to_load, None)
+                del self._queued_priorities[candidate]
+                source_img = self._mip_sources.pop(candidate, None)
+                if self._key_filepath(candidate) in self._roi_filepaths:
+                    key_to_load = candidate
+                else:
+                    self._loading_set.discard(candidate)
                     continue
-                img_bgra = None
-                try:
+            filepath_to_load = self._key_filepath(key_to_load)
+            level = key_to_load[1] if isinstance(key_to_load, tuple) else 1
+            if source_img is None and filepath_to_load not in self.frame_store and not os.path.exists(filepath_to_load):
+                GLib.idle_add(self._on_image_loaded_ui, key_to_load, None)
+                continue
+            img_bgra = None
+            try:
+                if source_img is None:
+                    source_img = self.frame_store.get(filepath_to_load)
+                if source_img is not None:
+                    img_bgra = source_img
+                else:
                     img_bgr = cv2.imread(str(filepath_to_load))
                     if img_bgr is not None:
                         img_bgra = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2BGRA)
-                except Exception as e:
-                    logging.warning(f"异步加载图片失败 {filepath_to_load}: {e}")
-                GLib.idle_add(self._on_image_loaded_ui, filepath_to_load, img_bgra)
+                        self.frame_store.submit(filepath_to_load, img_bgra)
+                if img_bgra is not None and level > 1:
+                    h, w = img_bgra.shape[:2]
+                    img_bgra = cv2.resize(img_bgra, (max(1, w // level), max(1, h // level)), interpolation=cv2.INTER_AREA)
+            except Exception as e:
+                logging.warning(f"异步加载图片失败 {filepath_to_load} (1/{level}): {e}")
+                img_bgra = None
+            GLib.idle_add(self._on_image_loaded_ui, key_to_load, img_bgra)
 
-    def _on_image_loaded_ui(self, filepath, img_bgra):
+    def _on_image_loaded_ui(self, key, img_bgra):
         with self._queue_lock:
-            if filepath in self._loading_set:
-                self._loading_set.remove(filepath)
+            self._loading_set.discard(key)
         if img_bgra is not None:
             surface = cairo.ImageSurface.create_for_data(img_bgra, cairo.FORMAT_ARGB32, img_bgra.shape[1], img_bgra.shape[0], img_bgra.strides[0])
-            self.surface_cache[filepath] = (surface, img_bgra)
-            self.surface_cache.move_to_end(filepath)
-            self._prune_cache()
-            self.emit('image-ready', filepath, surface)
+            self._cache_put(key, (surface, img_bgra))
+            self.emit('image-ready', self._key_filepath(key), surface)
+
+    @staticmethod
+    def _bundle_nbytes(bundle):
+        # surface 通过 create_for_data 直接引用数组内存，两者共用同一块像素数据，只计一次
+        surface, array = bundle
+        if array is not None:
+            return array.nbytes
+        return surface.get_stride() * surface.get_height()
+
+    def _cache_put(self, filepath, bundle):
+        self._cache_remove(filepath)
+        self.surface_cache[filepath] = bundle
+        self.cache_bytes += self._bundle_nbytes(bundle)
+        self._prune_cache()
+
+    def _cache_remove(self, filepath):
+        bundle = self.surface_cache.pop(filepath, None)
+        if bundle is not None:
+            self.cache_bytes -= self._bundle_nbytes(bundle)
+        return bundle
 
     def update_cache_limit(self, new_size):
         self.CACHE_SIZE = new_size
         self._prune_cache()
 
+    def update_cache_budget(self, budget_mb):
+        self.cache_byte_budget = budget_mb * 1024 * 1024
+        self._prune_cache()
+
     def _prune_cache(self):
-        excess = len(self.surface_cache) - self.CACHE_SIZE
-        if excess <= 0: return
+        """按最近最少使用顺序淘汰视口外的图片，直到张数和内存都不超过限制"""
+        def over_limit():
+            return len(self.surface_cache) > self.CACHE_SIZE or self.cache_bytes > self.cache_byte_budget
+        if not over_limit(): return
         keys_to_evict = []
         for key in self.surface_cache:
-            if key not in self._roi_filepaths:
+            if self._key_filepath(key) not in self._roi_filepaths:
                 keys_to_evict.append(key)
-                if len(keys_to_evict) == excess:
-                    break
         for key in keys_to_evict:
-            del self.surface_cache[key]
+            if not over_limit():
+                break
+            self._cache_remove(key)
+            self.cache_stats['evictions'] += 1
+
+    def load_frame_bgr(self, filepath):
+        """供最终拼接使用：优先从内存压缩缓存取出图片，未命中时返回 None"""
+        frame = self.frame_store.get(filepath)
+        return frame[:, :, :3] if frame is not None else None
+
+    def cache_report(self) -> str:
+        hits, misses = self.cache_stats['hits'], self.cache_stats['misses']
+        hit_rate = hits / (hits + misses) * 100 if hits + misses else 0.0
+        return (f"{len(self.surface_cache)} 张, {self.cache_bytes / 1024 / 1024:.1f}/{self.cache_byte_budget / 1024 / 1024:.0f} MB, "
+                f"命中 {hits} 次, 未命中 {misses} 次 ({hit_rate:.1f}%), 淘汰 {self.cache_stats['evictions']} 张")
+
+    def seam_range(self, abs_y1, abs_y2):
+        """返回位置 (即下一个条目的 absolute_y_start) 落在 [abs_y1, abs_y2) 内的接缝下标"""
+        lo = bisect.bisect_left(self._entry_abs_starts, abs_y1, 1)
+        hi = bisect.bisect_left(self._entry_abs_starts, abs_y2, 1)
+        return range(lo - 1, max(lo, hi) - 1)
+
+    def _mark_dirty(self, start, end):
+        if self._dirty_render_span is not None:
+            old_start, old_end = self._dirty_render_span
+            start = min(start, old_start)
+            end = None if end is None or old_end is None else max(end, old_end)
+        self._dirty_render_span = (start, end)
+
+    def take_dirty_render_span(self):
+        span, self._dirty_render_span = self._dirty_render_span, None
+        return span
 
-    def _regenerate_plans(self):
-        """生成渲染层并通知视图更新"""
-        self.render_plan = []
-        current_r_y = 0
-        restored_seams = {mod['seam_index'] for mod in self.modifications if mod['type'] == 'restore'}
-        raw_deletes = [(mod['y_start_abs'], mod['y_end_abs']) for mod in self.modifications if mod['type'] == 'delete']
-        raw_deletes.sort(key=lambda x: x[0])
-        merged_deletes = []
-        for start, end in raw_deletes:
-            if merged_deletes and start <= merged_deletes[-1][1]:
-                merged_deletes[-1] = (merged_deletes[-1][0], max(merged_deletes[-1][1], end))
-            else:
-                merged_deletes.append((start, end))
-        self.merged_del_regions = merged_deletes
-        for i, entry in enumerate(self.entries):
-            c_top = entry['crop_top']
-            c_bottom = entry['crop_bottom']
-            original_h = entry['height']
-            if i in restored_seams:
-                c_bottom = original_h
-            if (i - 1) in restored_seams:
-                c_top = 0
-            entry_abs_origin = entry['absolute_y_start']
-            valid_abs_start = entry_abs_origin + c_top
-            valid_abs_end = entry_abs_origin + c_bottom
-            if valid_abs_start >= valid_abs_end:
+    @property
+    def merged_del_regions(self):
+        return self.modification_index.merged_regions
+
+    def _stable_render_height(self):
+        """最近几张截图之上的渲染高度"""
+        first_unstable = len(self.entries) - self.UNSTABLE_ENTRIES
+        if first_unstable <= 0:
+            return 0
+        p = int(np.searchsorted(self.render_plan.column('entry_index'), first_unstable, side='left'))
+        return int(self.render_plan.column('render_y_start')[p]) if p < len(self.render_plan) else self.total_virtual_height
+
+    def _plan_entry(self, i, plan, render_y):
+        """把第 i 个条目未被删除的部分追加到 plan 中，返回新的 render_y"""
+        entry = self.entries[i]
+        c_top = entry['crop_top']
+        c_bottom = entry['crop_bottom']
+        index = self.modification_index
+        if index.is_restored(i):
+            c_bottom = entry['height']
+        if index.is_restored(i - 1):
+            c_top = 0
+        entry_abs_origin = entry['absolute_y_start']
+        valid_abs_start = entry_abs_origin + c_top
+        valid_abs_end = entry_abs_origin + c_bottom
+        if valid_abs_start >= valid_abs_end:
+            return render_y
+        visible_intervals = []
+        cursor = valid_abs_start
+        # 合并后的删除区域有序且互不重叠，只需从第一个可能相交的区域开始检查
+        k = index.first_region_index(valid_abs_start)
+        while cursor < valid_abs_end and k < len(index.merged_starts):
+            del_start, del_end = index.merged_starts[k], index.merged_ends[k]
+            if del_start >= valid_abs_end:
+                break
+            if del_end > cursor:
+                if del_start > cursor:
+                    visible_intervals.append((cursor, del_start))
+                cursor = del_end
+            k += 1
+        if cursor < valid_abs_end:
+            visible_intervals.append((cursor, valid_abs_end))
+        for abs_start, abs_end in visible_intervals:
+            height = abs_end - abs_start
+            if height < 1:
                 continue
-            visible_intervals = [(valid_abs_start, valid_abs_end)]
-            for del_start, del_end in self.merged_del_regions:
-                if not visible_intervals:
-                    break
-                new_intervals = []
-                for vis_start, vis_end in visible_intervals:
-                    if del_start < vis_end and del_end > vis_start:
-                        if vis_start < del_start:
-                            new_intervals.append((vis_start, del_start))
-                        if vis_end > del_end:
-                            new_intervals.append((del_end, vis_end))
-                    else:
-                        new_intervals.append((vis_start, vis_end))
-                visible_intervals = new_intervals
-            for abs_start, abs_end in visible_intervals:
-                height = abs_end - abs_start
-                if height < 1:
-                    continue
-                src_y = abs_start - entry_abs_origin
-                self.render_plan.append({
-                    'entry_index': i,
-                    'filepath': entry['filepath'],
-                    'absolute_y_start': abs_start,
-                    'absolute_y_end': abs_end,
-                    'render_y_start': current_r_y,
-                    'height': height,
-                    'src_y': src_y,
-                })
-                current_r_y += height
-        self.total_virtual_height = current_r_y
+            plan.append(i, entry['filepath'], abs_start, abs_end, render_y, height, abs_start - entry_abs_origin)
+            render_y += height
+        return render_y
+
+    def _replan_entries(self, first, last):
+        """只重新生成第 first 到 last 个条目的渲染层，其后的片段整体平移"""
+        plan = self.render_plan
+        entry_indices = plan.column('entry_index')
+        stale_from = int(np.searchsorted(entry_indices, len(self.entries), side='left'))
+        if stale_from < len(plan):
+            self.total_virtual_height = int(plan.column('render_y_start')[stale_from])
+            self._mark_dirty(self.total_virtual_height, None)
+            plan.truncate(stale_from)
+            if self.composite:
+                self.composite.resize(self.total_virtual_height)
+            entry_indices = plan.column('entry_index')
+        first = max(0, first)
+        last = min(last, len(self.entries) - 1)
+        if first <= last:
+            p_start = int(np.searchsorted(entry_indices, first, side='left'))
+            p_stop = int(np.searchsorted(entry_indices, last, side='right'))
+            render_y_start = int(plan.column('render_y_start')[p_start]) if p_start < len(plan) else self.total_virtual_height
+            old_height = int(plan.column('height')[p_start:p_stop].sum())
+            new_pieces = RenderPlan()
+            render_y = render_y_start
+            for i in range(first, last + 1):
+                render_y = self._plan_entry(i, new_pieces, render_y)
+            render_delta = (render_y - render_y_start) - old_height
+            plan.splice(p_start, p_stop, new_pieces, render_delta)
+            self.total_virtual_height += render_delta
+            if self.composite:
+                self.composite.replace(render_y_start, old_height, list(new_pieces), self.image_width, self.total_virtual_height, self._stable_render_height())
+            self._mark_dirty(render_y_start, render_y if render_delta == 0 else None)
+        GLib.idle_add(self.emit, 'model-updated')
+
+    def _replan_for_modification(self, mod, applied):
+        if applied:
+            self.modification_index.apply(mod)
+        else:
+            self.modification_index.revert(mod)
+        if mod['type'] == 'restore':
+            first = last = mod['seam_index']
+            last += 1
+        else:
+            first = max(0, bisect.bisect_right(self._entry_abs_starts, mod['y_start_abs']) - 1)
+            last = max(0, bisect.bisect_left(self._entry_abs_starts, mod['y_end_abs']) - 1)
+            # 裁剪值可能超出条目自身高度(未匹配时直接拼接)，按前缀极值向两侧扩展到所有可能受影响的条目
+            first = min(first, bisect.bisect_right(self._entry_reach_max, mod['y_start_abs']))
+            overhang = self._entry_overhang_max[-1] if self._entry_overhang_max else 0
+            last = max(last, bisect.bisect_left(self._entry_abs_starts, mod['y_end_abs'] + overhang) - 1)
+        self._replan_entries(first, last)
+
+    def _sync_entry_extents(self, first):
+        """从第 first 个条目起重新计算有效范围的前缀极值"""
+        del self._entry_reach_max[first:]
+        del self._entry_overhang_max[first:]
+        for entry in self.entries[first:]:
+            reach = entry['absolute_y_start'] + max(entry['height'], entry['crop_bottom'])
+            overhang = max(0, -entry['crop_top'])
+            if self._entry_reach_max:
+                reach = max(reach, self._entry_reach_max[-1])
+                overhang = max(overhang, self._entry_overhang_max[-1])
+            self._entry_reach_max.append(reach)
+            self._entry_overhang_max.append(overhang)
+
+    def _regenerate_plans(self):
+        """完整生成渲染层并通知视图更新"""
+        self.modification_index = ModificationIndex(self.modifications)
+        self.render_plan = RenderPlan(max(64, len(self.entries) * 2))
+        render_y = 0
+        for i in range(len(self.entries)):
+            render_y = self._plan_entry(i, self.render_plan, render_y)
+        if self.composite:
+            self.composite.replace(0, self.total_virtual_height, list(self.render_plan), self.image_width, render_y, self._stable_render_height())
+        self.total_virtual_height = render_y
+        self._mark_dirty(0, None)
         GLib.idle_add(self.emit, 'model-updated')
 
     def undo(self):
@@ -2281,7 +3793,7 @@ class StitchModel(GObject.Object):
         mod = self.modifications.pop()
         self.redo_stack.append(mod)
         logging.info(f"StitchModel: 撤销操作 {mod.get('type')}")
-        GLib.idle_add(self._regenerate_plans)
+        self._replan_for_modification(mod, applied=False)
         GLib.idle_add(self.emit, 'modification-stack-changed')
 
     def redo(self):
@@ -2291,7 +3803,7 @@ class StitchModel(GObject.Object):
         mod = self.redo_stack.pop()
         self.modifications.append(mod)
         logging.info(f"StitchModel: 重做操作 {mod.get('type')}")
-        GLib.idle_add(self._regenerate_plans)
+        self._replan_for_modification(mod, applied=True)
         GLib.idle_add(self.emit, 'modification-stack-changed')
 
     def add_modification(self, mod: dict):
@@ -2300,7 +3812,7 @@ class StitchModel(GObject.Object):
         if self.redo_stack:
             logging.debug("StitchModel: 新修改导致重做栈被清空")
             self.redo_stack.clear()
-        GLib.idle_add(self._regenerate_plans)
+        self._replan_for_modification(mod, applied=True)
         GLib.idle_add(self.emit, 'modification-stack-changed')
 
     def add_entry(self, filepath: str, width: int, height: int, shift: int, cut_y: int, box_y: int, thumb_data, full_img_data):
@@ -2324,6 +3836,7 @@ class StitchModel(GObject.Object):
         if not self.entries:
             self.image_width = width
             self.entries.append({'filepath': filepath, 'height': height, 'crop_top': 0, 'crop_bottom': height, 'shift': 0, 'box_y': box_y, 'absolute_y_start': 0, 'thumb': thumb_bundle})
+            self._entry_abs_starts.append(0)
         else:
             prev_entry = self.entries[-1]
             new_abs_start = prev_entry['absolute_y_start'] + prev_entry['height']
@@ -2335,12 +3848,14 @@ class StitchModel(GObject.Object):
             else:
                 prev_entry['crop_bottom'] = calculated_bottom
             self.entries.append({'filepath': filepath, 'height': height, 'crop_top': cut_y, 'crop_bottom': height, 'shift': shift, 'box_y': box_y, 'absolute_y_start': new_abs_start, 'thumb': thumb_bundle})
+            self._entry_abs_starts.append(new_abs_start)
             logging.info(f"添加第 {len(self.entries)} 张截图. prev_bottom: {prev_entry['crop_bottom']}, curr_top: {cut_y}, shift: {shift}")
+        self._sync_entry_extents(max(0, len(self.entries) - 2))
         if preloaded_bundle:
-            self.surface_cache[filepath] = preloaded_bundle
-            self.surface_cache.move_to_end(filepath)
-            self._prune_cache()
-        GLib.idle_add(self._regenerate_plans)
+            self._cache_put(filepath, preloaded_bundle)
+            self.frame_store.submit(filepath, preloaded_bundle[1])
+        # 新条目只会影响上一个条目的底部裁剪，只需重新生成末尾部分
+        self._replan_entries(len(self.entries) - 2, len(self.entries) - 1)
 
     def pop_entry(self):
         if not self.entries:
@@ -2354,7 +3869,9 @@ class StitchModel(GObject.Object):
         logging.debug(f"正在清理与截图 {last_entry_index} (abs_y: [{entry_abs_start}, {entry_abs_end}], seam_idx: {seam_index_to_remove}) 相关的修改")
         new_modifications = []
         removed_count = 0
-        for mod in self.modifications:
+        index = self.modification_index
+        has_related = index.overlaps(entry_abs_start, entry_abs_end) or index.is_restored(seam_index_to_remove)
+        for mod in (self.modifications if has_related else ()):
             mod_applies = False
             if mod['type'] == 'delete':
                 mod_start = mod['y_start_abs']
@@ -2372,14 +3889,18 @@ class StitchModel(GObject.Object):
                 new_modifications.append(mod)
         if removed_count > 0:
             self.modifications = new_modifications
+            self.modification_index = ModificationIndex(self.modifications)
             logging.debug(f"已移除 {removed_count} 个与被删除截图相关的修改")
             if self.redo_stack:
                 self.redo_stack.clear()
                 logging.debug("由于删除了截图，重做栈已清空")
             GLib.idle_add(self.emit, 'modification-stack-changed')
         popped_entry = self.entries.pop()
-        if popped_entry['filepath'] in self.surface_cache:
-            del self.surface_cache[popped_entry['filepath']]
+        self._entry_abs_starts.pop()
+        for level in self.MIP_LEVELS:
+            self._cache_remove(self._cache_key(popped_entry['filepath'], level))
+        self.frame_store.remove(popped_entry['filepath'])
+        if self._cache_remove(popped_entry['filepath']) is not None:
             logging.debug(f"从缓存中移除 {popped_entry['filepath']}")
         try:
             filepath_to_remove = Path(popped_entry['filepath'])
@@ -2394,14 +3915,24 @@ class StitchModel(GObject.Object):
         else:
             self.image_width = 0
             logging.info("所有截图已移除")
-        GLib.idle_add(self._regenerate_plans)
+        self._sync_entry_extents(max(0, len(self.entries) - 1))
+        if removed_count > 0:
+            self._regenerate_plans()
+        else:
+            self._replan_entries(len(self.entries) - 1, len(self.entries) - 1)
 
     def cleanup(self):
+        logging.info(f"预览缓存统计: {self.cache_report()}")
+        logging.info(f"内存压缩缓存统计: {self.frame_store.report()}")
+        self.frame_store.close()
+        if self.composite:
+            self.composite.close()
         self._worker_running = False
         with self._queue_lock:
             self._worker_condition.notify_all()
-        if self._loader_thread.is_alive():
-            self._loader_thread.join(timeout=0.5)
+        for thread in self._loader_threads:
+            if thread.is_alive():
+                thread.join(timeout=0.5)
 
 class CaptureMode(str, Enum):
     FREE = "自由模式"
@@ -3234,6 +4765,136 @@ class ScrollManager:
                 self.invisible_scroller.cleanup()
                 self.invisible_scroller = None
 
+class NotifyingQueue(queue.Queue):
+    """每次 put 时向管道写入一个字节，使主循环可以通过 fd 监听立即被唤醒"""
+    def __init__(self):
+        super().__init__()
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+        self._fd_lock = threading.Lock()
+        self._closed = False
+
+    def fileno(self) -> int:
+        return self._read_fd
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        with self._fd_lock:
+            if self._closed:
+                return
+            try:
+                os.write(self._write_fd, b'\x00')
+            except (BlockingIOError, OSError):
+                pass # 管道已满说明已有未处理的唤醒
+
+    def drain_wakeups(self):
+        try:
+            while os.read(self._read_fd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        with self._fd_lock:
+            if self._closed:
+                return
+            self._closed = True
+            for fd in (self._read_fd, self._write_fd):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+class AutoScrollScheduler:
+    """根据 StitchWorker 的积压情况调节自动滚动节奏和步长，并统计有效吞吐量"""
+    def __init__(self, config_obj: Config, session: CaptureSession, task_queue: queue.Queue):
+        self.config = config_obj
+        self.session = session
+        self.task_queue = task_queue
+        self._submit_times = collections.deque()
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.perf_counter()
+        self.throttled_time = 0.0
+        self.captures_done = 0
+        # 缓冲区px
+        self.stitched_px = 0
+        self._extra_overlap = 0.0
+        self._px_per_tick = 0.0
+        self._success_streak = 0
+        self._last_ticks = None
+        self._throttle_start = None
+
+    def on_task_submitted(self):
+        self._submit_times.append(time.perf_counter())
+
+    def on_result(self, stitched_px):
+        self.captures_done += 1
+        self.stitched_px += max(0, stitched_px)
+
+    def get_lag(self):
+        """返回 (未完成任务数, 最早未完成任务的等待时长 ms)"""
+        pending = self.task_queue.unfinished_tasks
+        while len(self._submit_times) > pending:
+            self._submit_times.popleft()
+        oldest_ms = (time.perf_counter() - self._submit_times[0]) * 1000 if self._submit_times else 0.0
+        return pending, oldest_ms
+
+    def should_wait(self) -> bool:
+        pending, oldest_ms = self.get_lag()
+        exceeded = pending > self.config.AUTO_SCROLL_MAX_PENDING or (pending > 0 and oldest_ms > self.config.AUTO_SCROLL_MAX_LAG_MS)
+        now = time.perf_counter()
+        if exceeded and self._throttle_start is None:
+            self._throttle_start = now
+            logging.debug(f"自动滚动：StitchWorker 积压 {pending} 个任务（最久 {oldest_ms:.0f} ms），暂停滚动")
+        elif not exceeded and self._throttle_start is not None:
+            self.throttled_time += now - self._throttle_start
+            self._throttle_start = None
+            logging.debug("自动滚动：StitchWorker 已追上，恢复滚动")
+        return exceeded
+
+    def choose_ticks(self) -> int:
+        """根据学习到的每格滚动距离和去除静态栏后的截图高度，选出仍保留安全重叠的最大格数"""
+        fixed_ticks = self.config.AUTO_SCROLL_TICKS_PER_STEP
+        if not self.config.AUTO_SCROLL_ADAPTIVE_STEP:
+            return fixed_ticks
+        history = self.session.scroll_stat_history
+        total_px = sum(d for dists in history.values() for d in dists)
+        total_ticks = sum(t * len(dists) for t, dists in history.items())
+        if total_ticks <= 0 or total_px <= 0:
+            return fixed_ticks
+        self._px_per_tick = total_px / total_ticks
+        # 逻辑px -> 缓冲区px
+        scale = self.session.scale
+        roi_h = self.session.geometry.get('h', 0) * scale
+        header, footer = self.session.static_bars[0] * scale, self.session.static_bars[1] * scale
+        scroll_budget = roi_h - header - footer - self.config.AUTO_SCROLL_MIN_OVERLAP - self._extra_overlap
+        ticks = max(1, int(scroll_budget // self._px_per_tick))
+        if ticks != self._last_ticks:
+            logging.debug(f"自动滚动：步长调整为 {ticks} 格（{self._px_per_tick:.1f}px/格，可用高度 {roi_h - header - footer:.0f}px，额外重叠 {self._extra_overlap:.0f}px）")
+            self._last_ticks = ticks
+        return ticks
+
+    def on_match_status(self, is_confident: bool):
+        if is_confident:
+            self._success_streak += 1
+            if self._success_streak >= 3 and self._extra_overlap > 0:
+                self._extra_overlap = max(0.0, self._extra_overlap - self._px_per_tick / 2)
+                self._success_streak = 0
+        else:
+            self._success_streak = 0
+            self._extra_overlap += max(self._px_per_tick, 1.0)
+            logging.debug(f"自动滚动：匹配不确信，额外重叠增加到 {self._extra_overlap:.0f}px")
+
+    def report(self) -> str:
+        now = time.perf_counter()
+        throttled = self.throttled_time + (now - self._throttle_start if self._throttle_start is not None else 0.0)
+        elapsed = max(1e-6, now - self.start_time)
+        return (f"{self.captures_done} 张截图，用时 {elapsed:.1f} 秒（等待拼接 {throttled:.1f} 秒），"
+                f"{self.captures_done / elapsed:.2f} 张/秒，{self.stitched_px / elapsed:.0f} px/秒")
+
 class ActionController:
     def __init__(self, session: CaptureSession, view: 'CaptureOverlay', config_obj: Config, frame_grabber: FrameGrabber):
         self.session = session
@@ -3250,7 +4911,8 @@ class ActionController:
         self._capture_filename_counter = 0
         self.stitch_model = StitchModel()
         self.task_queue = queue.Queue()
-        self.result_queue = queue.Queue()
+        self.result_queue = NotifyingQueue()
+        self.auto_scheduler = AutoScrollScheduler(self.config, self.session, self.task_queue)
         self.scroll_listener = None
         if not IS_WAYLAND:
             self.scroll_listener = XlibScrollListener(self.view)
@@ -3263,8 +4925,8 @@ class ActionController:
         )
         self.stitch_worker_running = True
         self.stitch_worker.start()
-        self.result_check_timer_id = GLib.timeout_add(100, self._check_result_queue)
-        logging.info("StitchWorker 后台线程及结果检查器已启动")
+        self.result_watch_id = GLib.io_add_watch(self.result_queue.fileno(), GLib.PRIORITY_DEFAULT, GLib.IOCondition.IN, self._on_result_queue_wakeup)
+        logging.info("StitchWorker 后台线程及结果监听器已启动")
         self.config_handler_id = self.config.connect('setting-changed', self._on_config_changed)
         self.stitch_model.connect('model-updated', self._on_model_updated)
 
@@ -3275,6 +4937,9 @@ class ActionController:
         elif key == 'preview_cache_size':
             logging.debug(f"预览缓存大小更新为 {self.config.PREVIEW_CACHE_SIZE}")
             self.stitch_model.update_cache_limit(self.config.PREVIEW_CACHE_SIZE)
+        elif key == 'preview_cache_memory_mb':
+            logging.debug(f"预览缓存内存上限更新为 {self.config.PREVIEW_CACHE_MEMORY_MB} MB")
+            self.stitch_model.update_cache_budget(self.config.PREVIEW_CACHE_MEMORY_MB)
 
     @property
     def is_auto_scrolling(self):
@@ -3289,6 +4954,11 @@ class ActionController:
             self.session.is_horizontally_locked = False
             logging.info("所有截图均已移除，已解锁边框水平调整功能")
 
+    def _on_result_queue_wakeup(self, fd, condition):
+        self.result_queue.drain_wakeups()
+        self._check_result_queue()
+        return True
+
     # 缓冲区px {
     def _check_result_queue(self):
         while not self.result_queue.empty():
@@ -3299,6 +4969,10 @@ class ActionController:
                 if result_type == 'ADD_RESULT':
                     filepath, width, height, shift, cut_y, abs_y, thumb_data, full_img_data = payload
                     self.stitch_model.add_entry(filepath, width, height, shift, cut_y, abs_y, thumb_data, full_img_data)
+                    if self.is_auto_scrolling:
+                        self.auto_scheduler.on_result(shift if self.stitch_model.capture_count > 1 else height)
+                elif result_type == 'MATCH_STATUS':
+                    self.auto_scheduler.on_match_status(payload)
                 elif result_type == 'STATIC_BARS_DETECTED':
                     h_header, h_footer, w_left, w_right = payload
                     self.session.set_static_bars(h_header, h_footer, w_left, w_right)
@@ -3324,8 +4998,8 @@ class ActionController:
         pending_new_trend = []
         last_action_was_pop = False
         last_detected_bars = (-1, -1, -1, -1)
-        cached_prev_filepath = None
-        cached_prev_img = None
+        # filepath -> {'img': 解码后的图像, 'top_textures': 预计算的纹理}，撤销后新的“上一张图”可直接从这里取出
+        decoded_frames = collections.OrderedDict()
         while True:
             try:
                 task = task_queue.get(timeout=1)
@@ -3363,6 +5037,7 @@ class ActionController:
                     shift = h_new
                     cut_y = 0
                     success = True
+                    is_confident = False
                     box_shift_y = current_box_y - prev_box_y
                     if ticks_scrolled > 0:
                         min_shift = ticks_scrolled * config.MIN_SCROLL_PER_TICK + box_shift_y
@@ -3372,8 +5047,10 @@ class ActionController:
                         max_shift = h_new
                     if prev_filepath_str:
                         logging.debug(f"StitchWorker: 计算 {filepath.name} 与 {Path(prev_filepath_str).name} 的重叠")
-                        if prev_filepath_str == cached_prev_filepath and cached_prev_img is not None:
-                            img_top = cached_prev_img
+                        prev_frame = decoded_frames.get(prev_filepath_str)
+                        if prev_frame is not None:
+                            decoded_frames.move_to_end(prev_filepath_str)
+                            img_top = prev_frame['img']
                         else:
                             img_top = cv2.imread(prev_filepath_str)
                             if img_top is None: raise ValueError(f"无法加载上一张图片 {prev_filepath_str}")
@@ -3411,10 +5088,13 @@ class ActionController:
                                                 logging.debug(f"StitchWorker: 均值推断候选 {inferred_dist}px (均值 {avg_px_per_tick:.2f}px/格, std={std_dev:.2f})")
                                 elif box_shift_y != 0:
                                     predicted_candidates.append(0)
+                                top_textures = prev_frame['top_textures'] if prev_frame is not None else None
+                                if top_textures is not None:
+                                    logging.debug(f"StitchWorker: 预测校验可复用 {Path(prev_filepath_str).name} 的预计算纹理")
                                 for cand_scroll_px in predicted_candidates:
                                     pred_shift = cand_scroll_px + box_shift_y
                                     if pred_shift >= h_top - h_footer: continue
-                                    score_pred, pred_cut_y = ImageMatcher.verify_region(img_top, img_new, pred_shift, h_header, detected_bars, box_shift_y)
+                                    score_pred, pred_cut_y = ImageMatcher.verify_region(img_top, img_new, pred_shift, h_header, detected_bars, box_shift_y, top_textures)
                                     cand = {'shift': pred_shift, 'cut_y': pred_cut_y, 'score': score_pred, 'source': 'prediction'}
                                     if score_pred > ImageMatcher.THRES_SCORE:
                                         final_best_candidate = cand
@@ -3469,6 +5149,9 @@ class ActionController:
                                 else:
                                     logging.debug(f"StitchWorker: 检测微小重叠失败，row_h={row_h}")
                                     success = False
+                            is_confident = success and (final_best_candidate is None or final_best_candidate['score'] > ImageMatcher.THRES_SCORE)
+                            if is_auto_mode:
+                                result_queue.put(('MATCH_STATUS', is_confident))
                         else:
                             logging.debug("StitchWorker: 匹配已禁用，执行直接拼接")
                             shift = h_top
@@ -3525,8 +5208,15 @@ class ActionController:
                             logging.debug(f"StitchWorker: 学习数据 -> {ticks_scrolled}格 = {actual_scroll_px}px")
                             result_queue.put(('LEARNED_SCROLL', (ticks_scrolled, actual_scroll_px)))
                     result_queue.put(('ADD_RESULT', (filepath_str, w_new, h_new, shift, cut_y, current_box_y, thumb_data, full_img_data)))
-                    cached_prev_filepath = filepath_str
-                    cached_prev_img = img_new
+                    current_frame = {'img': img_new, 'top_textures': None}
+                    decoded_frames[filepath_str] = current_frame
+                    while len(decoded_frames) > max(1, config.DECODED_FRAME_CACHE_SIZE):
+                        decoded_frames.popitem(last=False)
+                    if is_confident and shift > box_shift_y and last_detected_bars[0] >= 0 and task_queue.empty():
+                        # 下一张图大概率以相同距离滚动，在滚动和等待截图期间预先计算只依赖本张图的部分
+                        next_shift = shift - box_shift_y
+                        textures = ImageMatcher.precompute_top_textures(img_new, h_new, w_new, next_shift, last_detected_bars[0], last_detected_bars)
+                        current_frame['top_textures'] = textures
                 except Exception as e:
                     logging.error(f"StitchWorker: 处理 ADD 任务时出错 ({filepath.name}): {e}")
                     GLib.idle_add(send_notification, "图片处理错误", f"无法处理截图 {Path(filepath_str).name}: {e}", "warning", config.WARNING_SOUND)
@@ -3544,8 +5234,6 @@ class ActionController:
             elif task.get('type') == 'POP':
                 logging.debug("StitchWorker: 收到 POP 任务，发送确认")
                 last_action_was_pop = True
-                cached_prev_filepath = None
-                cached_prev_img = None
                 result_queue.put(('POP_ACK', None))
                 task_queue.task_done()
         logging.debug("StitchWorker 线程已结束")
@@ -3691,6 +5379,7 @@ class ActionController:
                     'ticks_scrolled': real_ticks
                 }
                 self.task_queue.put(task)
+                self.auto_scheduler.on_task_submitted()
                 return True
             else:
                 logging.error(f"截图失败: {filepath}")
@@ -3741,6 +5430,7 @@ class ActionController:
             self.saved_cursor_pos = self.scroll_manager.get_pointer_position(target=CoordSys.GLOBAL)
             logging.debug(f"自动模式：记录原始光标位置 {self.saved_cursor_pos}")
         self.pending_capture = False
+        self.auto_scheduler.reset()
         if self.stitch_model.capture_count == 0:
             logging.info("自动模式：首次启动，先进行截图")
             self._auto_capture_step()
@@ -3753,6 +5443,7 @@ class ActionController:
         if not self.is_auto_scrolling:
             return
         logging.info("正在停止自动滚动...")
+        logging.info(f"自动模式统计: {self.auto_scheduler.report()}")
         global hotkey_manager
         if hotkey_manager:
             hotkey_manager.enable_mouse_click_monitor(False)
@@ -3800,7 +5491,10 @@ class ActionController:
             logging.debug("自动滚动：正在处理上一动作，等待 100 ms")
             self.auto_scroll_timer_id = GLib.timeout_add(100, self._auto_scroll_step)
             return False
-        ticks_to_scroll = self.config.AUTO_SCROLL_TICKS_PER_STEP
+        if self.auto_scheduler.should_wait():
+            self.auto_scroll_timer_id = GLib.timeout_add(50, self._auto_scroll_step)
+            return False
+        ticks_to_scroll = self.auto_scheduler.choose_ticks()
         self.scroll_manager.scroll_discrete(ticks_to_scroll, return_cursor=False)
         logging.debug(f"自动滚动: 滚动 {ticks_to_scroll} 格, 等待 {self.config.AUTO_SCROLL_INTERVAL_MS} ms 后截图")
         self.accumulated_scroll_ticks += ticks_to_scroll
@@ -3838,9 +5532,20 @@ class ActionController:
             self.perform_cleanup()
             return
         JPEG_MAX_DIMENSION = 65500
-        if self.config.SAVE_FORMAT == 'JPEG' and (self.stitch_model.image_width > JPEG_MAX_DIMENSION or self.stitch_model.total_virtual_height > JPEG_MAX_DIMENSION):
+        output_height = self.stitch_model.total_virtual_height
+        if self.config.PAGE_MAX_HEIGHT > 0:
+            output_height = min(output_height, self.config.PAGE_MAX_HEIGHT)
+        if self.config.SAVE_FORMAT == 'JPEG' and (self.stitch_model.image_width > JPEG_MAX_DIMENSION or output_height > JPEG_MAX_DIMENSION):
             logging.warning(f"长图尺寸 ({self.stitch_model.image_width}x{self.stitch_model.total_virtual_height}) 超过 JPEG 上限，中止完成流程")
-            msg = f"当前尺寸已超出 JPEG 上限\n请切换为 PNG 格式或确保图片宽高不超过 {JPEG_MAX_DIMENSION} 像素"
+            msg = f"当前尺寸已超出 JPEG 上限\n请切换为 PNG 格式、设置分页高度或确保图片宽高不超过 {JPEG_MAX_DIMENSION} 像素"
+            send_notification("长图尺寸过大", msg, "warning", config.WARNING_SOUND, 5)
+            if not self.view.config_panel.get_visible():
+                self.view.toggle_config_panel()
+            self.view.config_panel.switch_to_page("output")
+            return
+        if self.config.SAVE_FORMAT == 'WEBP' and self.stitch_model.image_width > WEBP_MAX_DIMENSION:
+            logging.warning(f"长图宽度 {self.stitch_model.image_width} 超过 WebP 上限，中止完成流程")
+            msg = f"当前宽度已超出 WebP 上限\n请切换为其他格式或确保图片宽度不超过 {WEBP_MAX_DIMENSION} 像素"
             send_notification("长图尺寸过大", msg, "warning", config.WARNING_SOUND, 5)
             if not self.view.config_panel.get_visible():
                 self.view.toggle_config_panel()
@@ -3885,6 +5590,7 @@ class ActionController:
             GLib.idle_add(feedback_widget.set_progress, fraction)
         def update_label_text(text):
             GLib.idle_add(feedback_widget.set_text, text)
+        canvas_path = None
         try:
             if not render_plan:
                 logging.warning("传入的截图列表为空，退出处理")
@@ -3893,58 +5599,117 @@ class ActionController:
             now = datetime.now()
             timestamp_str = now.strftime(config.FILENAME_TIMESTAMP_FORMAT)
             base_filename = config.FILENAME_TEMPLATE.replace('{timestamp}', timestamp_str)
-            file_extension = 'jpg' if config.SAVE_FORMAT == 'JPEG' else 'png'
+            file_extension = OUTPUT_EXTENSIONS.get(config.SAVE_FORMAT, 'png')
             final_filename = f"{base_filename}.{file_extension}"
             output_file = config.SAVE_DIRECTORY / final_filename
             output_file.parent.mkdir(parents=True, exist_ok=True)
-            stitch_start_time = time.perf_counter()
-            stitched_image = stitch_images_in_memory_from_model(
-                render_plan=render_plan,
-                image_width=image_width,
-                total_height=total_height,
-                progress_callback=update_progress
-            )
-            stitch_duration = time.perf_counter() - stitch_start_time
-            logging.info(f"图片拼接总耗时: {stitch_duration:.3f} 秒")
-            if stitched_image is not None:
-                update_label_text("正在保存...")
+            composite = self.stitch_model.composite
+            stitched_image = None
+            if composite:
+                update_label_text("正在等待后台拼接...")
+                stitch_start_time = time.perf_counter()
+                stitched_image = composite.finish(total_height)
+                if stitched_image is not None:
+                    logging.info(f"使用截图过程中增量合成的画布，等待耗时: {time.perf_counter() - stitch_start_time:.3f} 秒")
+            page_height = config.PAGE_MAX_HEIGHT
+            if config.SAVE_FORMAT == 'WEBP':
+                # WebP 宽高上限为 16383 像素，超出时自动分页
+                page_height = min(page_height or WEBP_MAX_DIMENSION, WEBP_MAX_DIMENSION)
+            paginate = config.SAVE_FORMAT not in ('PDF', 'DZI') and 0 < page_height < total_height
+            if config.SAVE_FORMAT in ('JPEG', 'WEBP') and stitched_image is None and not paginate:
+                stitch_start_time = time.perf_counter()
+                canvas_path = out_of_core_canvas_path(image_width, total_height)
+                stitched_image = stitch_images_in_memory_from_model(
+                    render_plan=render_plan,
+                    image_width=image_width,
+                    total_height=total_height,
+                    progress_callback=update_progress,
+                    load_image=self.stitch_model.load_frame_bgr,
+                    threads=output_thread_count(),
+                    canvas_path=canvas_path
+                )
+                stitch_duration = time.perf_counter() - stitch_start_time
+                logging.info(f"图片拼接总耗时: {stitch_duration:.3f} 秒")
+                if stitched_image is None:
+                    return
+            update_label_text("正在保存...")
+            save_start_time = time.perf_counter()
+            result_file, result_height = output_file, total_height
+            saved_files = [output_file]
+            if config.SAVE_FORMAT == 'PDF':
+                pages = find_page_breaks(render_plan, stitched_image, image_width, total_height, pdf_page_height(image_width), self.stitch_model.load_frame_bgr)
+                logging.debug(f"以 PDF 格式保存，共 {len(pages)} 页")
+                success = write_pdf(output_file, pages, render_plan, stitched_image, image_width, self.stitch_model.load_frame_bgr, update_progress)
+                result_height = pages[0][1] - pages[0][0]
+            elif paginate:
+                pages = find_page_breaks(render_plan, stitched_image, image_width, total_height, page_height, self.stitch_model.load_frame_bgr)
+                logging.info(f"长图高度 {total_height} 超过分页高度 {page_height}，分为 {len(pages)} 页保存")
+                page_files = save_pages(output_file, pages, render_plan, stitched_image, image_width, config.SAVE_FORMAT, self.stitch_model.load_frame_bgr, update_progress)
+                result_file, result_height = page_files[0], pages[0][1] - pages[0][0]
+                saved_files = page_files
+                success = True
+            elif config.SAVE_FORMAT == 'DZI':
+                # 通知中打开的是 HTML 查看器，由默认程序 (浏览器) 打开即可，无需按大图处理
+                result_file = write_dzi(output_file, render_plan, stitched_image, image_width, total_height, self.stitch_model.load_frame_bgr, update_progress)
+                result_height = 0
+                saved_files = [output_file, result_file, *DeepZoomWriter.tiles_directory(output_file).rglob('*.*')]
+                success = True
+            elif config.SAVE_FORMAT in ('JPEG', 'WEBP'):
                 update_progress(1.0)
-                save_start_time = time.perf_counter()
-                if config.SAVE_FORMAT == 'JPEG':
-                    logging.debug(f"以 JPEG 格式保存，质量为 {config.JPEG_QUALITY}")
-                    success = cv2.imwrite(str(output_file), stitched_image, [int(cv2.IMWRITE_JPEG_QUALITY), config.JPEG_QUALITY])
-                else:
-                    logging.debug("以 PNG 格式保存")
-                    success = cv2.imwrite(str(output_file), stitched_image, [int(cv2.IMWRITE_PNG_COMPRESSION), 3])
-                if not success:
-                    raise RuntimeError(f"无法将长图 {output_file} 写入磁盘")
-                save_duration = time.perf_counter() - save_start_time
-                logging.info(f"图片成功拼接并保存到: {output_file}，保存耗时: {save_duration:.3f} 秒")
-                total_finalize_duration = time.perf_counter() - finalize_start_time
-                logging.info(f"完成最终处理总耗时: {total_finalize_duration:.3f} 秒")
-                def _on_save_success():
-                    clipboard_msg = ""
-                    if config.COPY_TO_CLIPBOARD_ON_FINISH:
-                        update_label_text("复制到剪贴板...")
-                        logging.debug("开始复制到剪贴板")
-                        _, cb_msg = SystemInteraction.copy_to_clipboard(output_file)
-                        clipboard_msg = f"\n{cb_msg}"
-                    message = f"已保存到: {output_file}{clipboard_msg}"
-                    send_notification(
-                        title="长截图拼接成功",
-                        message=message,
-                        level="success",
-                        sound_name=config.FINALIZE_SOUND,
-                        timeout=8,
-                        action_config={'path': output_file, 'width': image_width, 'height': total_height}
-                    )
-                    self._release_heavy_resources()
-                    self.session.set_finished(True)
-                GLib.idle_add(_on_save_success)
+                write_params = opencv_write_params(config.SAVE_FORMAT)
+                logging.debug(f"以 {config.SAVE_FORMAT} 格式保存，参数: {write_params}")
+                success = cv2.imwrite(str(output_file), stitched_image, write_params)
+            elif config.SAVE_FORMAT == 'TIFF':
+                logging.debug("以分块 TIFF 格式保存")
+                bands = iter_region_bands(render_plan, stitched_image, image_width, 0, total_height, StreamingTiledTIFFWriter.TILE_SIZE,
+                                          self.stitch_model.load_frame_bgr, update_progress, output_thread_count())
+                success = write_tiff_from_bands(output_file, image_width, total_height, bands)
+            elif stitched_image is not None:
+                encoded_blocks = composite.encoded_blocks
+                logging.info(f"以 PNG 格式保存增量合成的画布，已预编码 {len(encoded_blocks) * StreamingPNGWriter.BAND_HEIGHT}/{total_height} 行")
+                success = write_png_from_canvas(output_file, stitched_image, encoded_blocks, update_progress)
+            else:
+                logging.debug("以 PNG 格式流式拼接并保存")
+                success = write_png_from_render_plan(
+                    output_file, render_plan, image_width, total_height,
+                    progress_callback=update_progress,
+                    load_image=self.stitch_model.load_frame_bgr
+                )
+            if not success:
+                raise RuntimeError(f"无法将长图 {output_file} 写入磁盘")
+            save_duration = time.perf_counter() - save_start_time
+            saved_desc = f"{result_file.parent} (共 {len(pages)} 页)" if paginate else output_file
+            logging.info(f"图片成功拼接并保存到: {saved_desc}，保存耗时: {save_duration:.3f} 秒")
+            saved_bytes = sum(f.stat().st_size for f in saved_files)
+            logging.info(f"{config.SAVE_FORMAT} 编码耗时: {save_duration:.3f} 秒，文件大小: {saved_bytes / 1024 / 1024:.2f} MB，"
+                         f"{image_width}x{total_height}，{saved_bytes * 8 / max(1, image_width * total_height):.3f} bpp")
+            total_finalize_duration = time.perf_counter() - finalize_start_time
+            logging.info(f"完成最终处理总耗时: {total_finalize_duration:.3f} 秒")
+            def _on_save_success():
+                clipboard_msg = ""
+                if config.COPY_TO_CLIPBOARD_ON_FINISH:
+                    update_label_text("复制到剪贴板...")
+                    logging.debug("开始复制到剪贴板")
+                    _, cb_msg = SystemInteraction.copy_to_clipboard(result_file)
+                    clipboard_msg = f"\n{cb_msg}"
+                message = f"已分为 {len(pages)} 页保存到: {result_file.parent}{clipboard_msg}" if paginate else f"已保存到: {result_file}{clipboard_msg}"
+                send_notification(
+                    title="长截图拼接成功",
+                    message=message,
+                    level="success",
+                    sound_name=config.FINALIZE_SOUND,
+                    timeout=8,
+                    action_config={'path': result_file, 'width': image_width, 'height': result_height}
+                )
+                self._release_heavy_resources()
+                self.session.set_finished(True)
+            GLib.idle_add(_on_save_success)
         except Exception as e:
             logging.error(f"最终处理时发生错误: {e}")
             GLib.idle_add(self.perform_cleanup)
         finally:
+            if canvas_path is not None:
+                canvas_path.unlink(missing_ok=True)
             GLib.idle_add(self.view.overlay_manager.dismiss, feedback_widget)
 
     def quit_and_cleanup(self, widget=None):
@@ -3973,15 +5738,16 @@ class ActionController:
             hotkey_manager.stop()
         if self.config_handler_id:
             self.config.disconnect(self.config_handler_id)
-        if self.result_check_timer_id:
-            GLib.source_remove(self.result_check_timer_id)
-            self.result_check_timer_id = None
-            logging.debug("结果检查定时器已移除")
+        if self.result_watch_id:
+            GLib.source_remove(self.result_watch_id)
+            self.result_watch_id = None
+            logging.debug("结果监听器已移除")
         if self.stitch_worker_running:
             logging.debug("检测到 StitchWorker 仍在运行，尝试最后停止...")
             self.task_queue.put({'type': 'EXIT'})
             self.stitch_worker.join(timeout=0.5)
             self.stitch_worker_running = False
+        self.result_queue.close()
         if self.scroll_listener:
             self.scroll_listener.stop()
         known_files = [entry['filepath'] for entry in self.stitch_model.entries]
@@ -4646,7 +6412,7 @@ class ConfigPanel(SimulatedWindow):
             ('Interface.Theme', 'notification_css'),
             ('Interface.Theme', 'mask_css'), ('Interface.Theme', 'dialog_css'), ('Interface.Theme', 'feedback_widget_css'),
             ('System', 'max_viewer_dimension'), ('System', 'large_image_opener'),
-            ('Performance', 'max_scroll_per_tick'), ('Performance', 'min_scroll_per_tick'), ('Preview', 'preview_cache_size'),
+            ('Performance', 'max_scroll_per_tick'), ('Performance', 'min_scroll_per_tick'), ('Preview', 'preview_cache_size'), ('Preview', 'preview_cache_memory_mb'),
             ('System', 'sound_theme'), ('System', 'capture_sound'), ('System', 'undo_sound'), ('System', 'finalize_sound'), ('System', 'warning_sound'),
             ('System', 'log_file')
         ]
@@ -4982,7 +6748,7 @@ class ConfigPanel(SimulatedWindow):
             self.filename_preview_label.get_style_context().add_class("error")
             return
         filename_base = template.replace('{timestamp}', timestamp_str)
-        extension = 'jpg' if file_format == 'JPEG' else 'png'
+        extension = OUTPUT_EXTENSIONS.get(file_format, 'png')
         final_filename = f"{filename_base}.{extension}"
         escaped_filename = GLib.markup_escape_text(final_filename)
         self.filename_preview_label.set_markup(f"<i>{escaped_filename}</i>")
@@ -5032,12 +6798,16 @@ class ConfigPanel(SimulatedWindow):
         grid1.attach(hbox, 1, 0, 1, 1)
         # 文件格式
         label = Gtk.Label(label="文件类型:", xalign=0)
-        label.set_tooltip_markup("选择图片的保存格式\n<b>PNG</b>: 无损压缩\n<b>JPEG</b>: 有损压缩，具有 65500 像素的尺寸上限")
+        label.set_tooltip_markup("选择图片的保存格式\n<b>PNG</b>: 无损压缩\n<b>JPEG</b>: 有损压缩，具有 65500 像素的尺寸上限\n<b>WebP</b>: 默认无损压缩，体积通常小于 PNG，高度超过 16383 像素时自动分页\n<b>TIFF</b>: 分块存储，其他工具可以只读取局部区域\n<b>PDF</b>: 按页面分割的多页文档，适合文档类长截图\n<b>DZI</b>: 瓦片金字塔和网页查看器，超长截图也能在浏览器中即时打开")
         self.format_combo = Gtk.ComboBoxText()
         self.format_combo.set_tooltip_markup(label.get_tooltip_markup())
         self.format_combo.connect("scroll-event", lambda widget, event: True)
         self.format_combo.append("PNG", "PNG")
         self.format_combo.append("JPEG", "JPEG")
+        self.format_combo.append("WEBP", "WebP")
+        self.format_combo.append("TIFF", "TIFF")
+        self.format_combo.append("PDF", "PDF")
+        self.format_combo.append("DZI", "DZI")
         self.format_combo.connect("changed", self._on_format_changed)
         self.widget_map['save_format'] = self.format_combo
         cell = self.format_combo.get_cells()[0]
@@ -5248,7 +7018,7 @@ class ConfigPanel(SimulatedWindow):
         grid2.set_column_spacing(15)
         frame2.add(grid2)
         auto_configs = [
-            ("auto_scroll_ticks_per_step", "滚动步长 (格)", (1, 8), (1, 2), "自动模式下，每一步滚动几格"),
+            ("auto_scroll_ticks_per_step", "滚动步长 (格)", (1, 8), (1, 2), "自动模式下，每一步滚动几格\n启用自适应步长（配置文件中的 <b>auto_scroll_adaptive_step</b>）时，仅在学习到滚动距离之前使用"),
             ("auto_scroll_interval_ms", "滚动间隔 (ms)", (50, 800), (50, 100), "自动模式下，每次滚动完后等待截图的间隔时间")
         ]
         for i, (key, desc, (min_val, max_val), (step, page), tooltip) in enumerate(auto_configs):
@@ -5445,7 +7215,7 @@ class ConfigPanel(SimulatedWindow):
         scrolled.add(vbox)
         system_perf_settings = [
             ('System', 'max_viewer_dimension'), ('System', 'large_image_opener'),
-            ('Performance', 'max_scroll_per_tick'), ('Performance', 'min_scroll_per_tick'), ('Preview', 'preview_cache_size'),
+            ('Performance', 'max_scroll_per_tick'), ('Performance', 'min_scroll_per_tick'), ('Preview', 'preview_cache_size'), ('Preview', 'preview_cache_memory_mb'),
             ('System', 'sound_theme'), ('System', 'capture_sound'), ('System', 'undo_sound'), ('System', 'finalize_sound'), ('System', 'warning_sound'),
             ('System', 'log_file'),
         ]
@@ -5490,7 +7260,8 @@ class ConfigPanel(SimulatedWindow):
         performance_configs = [
             ("max_scroll_per_tick", "每格最大滚动像素", (120, 500), (10, 50), "用于匹配和校准的最大滚动阈值（单位：缓冲区px），需要不小于实际滚动单位"),
             ("min_scroll_per_tick", "每格最小滚动像素", (1, 60), (1, 10), "用于匹配和校准的最小滚动阈值（单位：缓冲区px），可以大于实际滚动单位"),
-            ("preview_cache_size", "预览缓存大小 (张)", (10, 50), (1, 5), "预览在内存中保留的图片数量，不会少于视口内的图片数量，增加可减少加载时间但会占用更多内存")
+            ("preview_cache_size", "预览缓存大小 (张)", (10, 50), (1, 5), "预览在内存中保留的图片数量，不会少于视口内的图片数量，增加可减少加载时间但会占用更多内存"),
+            ("preview_cache_memory_mb", "预览缓存内存 (MB)", (64, 8192), (16, 128), "预览缓存占用内存的上限，与缓存张数任一超出时都会淘汰视口外最久未使用的图片，截图区域较大时主要受此项限制")
         ]
         num_items = len(performance_configs)
         mid_point = (num_items + 1) // 2
@@ -5860,6 +7631,8 @@ class ConfigPanel(SimulatedWindow):
 
 class PreviewPanel(SimulatedWindow):
     """显示长图预览的面板"""
+    MINIMAP_WIDTH = 48 # 逻辑px
+    MINIMAP_MAX_HEIGHT = 32767 # 小地图px，cairo 图像面的高度上限
     def __init__(self, model: StitchModel, config_obj: Config, parent_overlay: 'CaptureOverlay'):
         super().__init__(parent_overlay, title="长图预览", css_class="simulated-window", resizable=True)
         self.model = model
@@ -5889,6 +7662,16 @@ class PreviewPanel(SimulatedWindow):
         self.last_scroll_y = 0
         self.scroll_dy = 0
         self.last_roi_set = set()
+        self.last_roi_key = None
+        self._backing = None # 视口区域的后备缓冲 (逻辑px)
+        self._minimap_surface = None # 由缩略图合成的整张长图概览 (小地图px)
+        self._minimap_height = 0
+        self._minimap_scale = None
+        self._minimap_scale_y = None
+        self._minimap_dragging = False
+        self._backing_rect = None
+        self._backing_key = None
+        self._dirty_render_spans = []
         top_button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         top_button_box.set_margin_top(0)
         top_button_box.set_margin_bottom(0)
@@ -5930,7 +7713,19 @@ class PreviewPanel(SimulatedWindow):
         top_button_box.pack_start(self.btn_redo_mod, False, False, 0)
         self.scrolled_window = Gtk.ScrolledWindow()
         self.scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
-        self.add_content(self.scrolled_window, expand=True, fill=True)
+        content_hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=0)
+        content_hbox.pack_start(self.scrolled_window, True, True, 0)
+        self.minimap_area = Gtk.DrawingArea()
+        self.minimap_area.set_size_request(self.MINIMAP_WIDTH, -1)
+        self.minimap_area.add_events(
+            Gdk.EventMask.BUTTON_PRESS_MASK |
+            Gdk.EventMask.BUTTON_RELEASE_MASK |
+            Gdk.EventMask.POINTER_MOTION_MASK
+        )
+        self.minimap_area.set_tooltip_text("缩略导航：点击或拖动可快速跳转")
+        self.minimap_area.set_no_show_all(not self.config.PREVIEW_SHOW_MINIMAP)
+        content_hbox.pack_start(self.minimap_area, False, False, 0)
+        self.add_content(content_hbox, expand=True, fill=True)
         self.drawing_area = Gtk.DrawingArea()
         self.drawing_area.add_events(
             Gdk.EventMask.EXPOSURE_MASK |
@@ -5974,13 +7769,18 @@ class PreviewPanel(SimulatedWindow):
         self.zoom_label.set_margin_start(5)
         button_hbox.pack_start(self.zoom_label, False, False, 0)
         self.model.connect("model-updated", self.on_model_updated)
-        self.model.connect("image-ready", lambda m, f, p: self.drawing_area.queue_draw())
+        self.model.connect("image-ready", self._on_model_image_ready)
         self.model.connect('modification-stack-changed', lambda m: self._update_button_sensitivity())
         v_adj = self.scrolled_window.get_vadjustment()
         if v_adj:
             v_adj.connect("value-changed", self.on_scroll_changed)
+            v_adj.connect("value-changed", lambda adj: self.minimap_area.queue_draw())
             v_adj.connect("changed", self._update_button_sensitivity)
         self.drawing_area.connect("draw", self.on_draw)
+        self.minimap_area.connect("draw", self._on_minimap_draw)
+        self.minimap_area.connect("button-press-event", self._on_minimap_button_press)
+        self.minimap_area.connect("motion-notify-event", self._on_minimap_motion_notify)
+        self.minimap_area.connect("button-release-event", self._on_minimap_button_release)
         self.drawing_area.connect("button-press-event", self._on_drawing_area_button_press)
         self.drawing_area.connect("motion-notify-event", self._on_drawing_area_motion_notify)
         self.drawing_area.connect("button-release-event", self._on_drawing_area_button_release)
@@ -6088,6 +7888,10 @@ class PreviewPanel(SimulatedWindow):
             self._apply_pending_scroll()
 
     def on_model_updated(self, model_instance):
+        dirty_span = self.model.take_dirty_render_span()
+        if dirty_span is not None:
+            self._invalidate_render_range(*dirty_span)
+        self._update_minimap(dirty_span)
         if self.model.capture_count == 0 and self.is_selection_mode:
             logging.debug("模型已空，预览面板自动退出选择模式")
             self.cancel_selection_mode()
@@ -6198,30 +8002,33 @@ class PreviewPanel(SimulatedWindow):
 
     def _absolute_y_to_render_y(self, absolute_y):
         # 缓冲区px
-        if not self.model.render_plan:
+        plan = self.model.render_plan
+        if not plan:
             return absolute_y
-        for piece in self.model.render_plan:
-            if piece['absolute_y_start'] <= absolute_y < piece['absolute_y_end']:
-                return piece['render_y_start'] + (absolute_y - piece['absolute_y_start'])
-            elif piece['absolute_y_start'] > absolute_y:
-                return piece['render_y_start']
-        last = self.model.render_plan[-1]
-        return last['render_y_start'] + last['height']
+        abs_starts = plan.column('absolute_y_start')
+        render_y_starts = plan.column('render_y_start')
+        index = int(np.searchsorted(abs_starts, absolute_y, side='right')) - 1
+        if index >= 0 and absolute_y < plan.column('absolute_y_end')[index]:
+            return int(render_y_starts[index]) + (absolute_y - int(abs_starts[index]))
+        # 落在被删除或裁掉的区域内时，映射到其后第一个片段的起点
+        if index + 1 < len(plan):
+            return int(render_y_starts[index + 1])
+        return int(render_y_starts[-1] + plan.column('height')[-1])
 
     def _render_y_to_absolute_y(self, render_y):
         # 缓冲区px
         if not self.model.render_plan:
             return render_y
-        piece_render_y_starts = [p['render_y_start'] for p in self.model.render_plan]
-        index = max(0, bisect.bisect_right(piece_render_y_starts, render_y) - 1)
-        piece = self.model.render_plan[index]
-        if render_y >= piece['render_y_start'] + piece['height']:
-            if index + 1 < len(self.model.render_plan):
-                next_piece = self.model.render_plan[index + 1]
-                return next_piece['absolute_y_start']
+        plan = self.model.render_plan
+        index = plan.index_at_render_y(render_y)
+        render_y_starts = plan.column('render_y_start')
+        abs_starts = plan.column('absolute_y_start')
+        if render_y >= render_y_starts[index] + plan.column('height')[index]:
+            if index + 1 < len(plan):
+                return int(abs_starts[index + 1])
             else:
-                return piece['absolute_y_end']
-        return piece['absolute_y_start'] + render_y - piece['render_y_start']
+                return int(plan.column('absolute_y_end')[index])
+        return int(abs_starts[index]) + render_y - int(render_y_starts[index])
 
     def _update_selection_from_pointer(self):
         if not self.selection_action:
@@ -6301,21 +8108,19 @@ class PreviewPanel(SimulatedWindow):
             logging.warning("恢复操作已取消：当前选区无效")
             return
         mods_added = 0
-        restored_seams_indices = {mod['seam_index'] for mod in self.model.modifications if mod['type'] == 'restore'}
-        for i, entry in enumerate(self.model.entries[:-1]):
-            next_entry = self.model.entries[i+1]
-            seam_abs_y = next_entry['absolute_y_start']
-            if sel_start_abs <= seam_abs_y < sel_end_abs:
-                if i in restored_seams_indices:
-                    logging.debug(f"接缝 {i} 已被恢复，跳过")
-                    continue
-                if any(del_start <= seam_abs_y < del_end for del_start, del_end in self.model.merged_del_regions):
-                    logging.debug(f"接缝 {i} 位于已删除区域内，跳过恢复操作")
-                    continue
-                logging.debug(f"选区跨越接缝 {i} (abs_y: {seam_abs_y})，添加恢复修改")
-                mod = {'type': 'restore', 'seam_index': i}
-                self.model.add_modification(mod)
-                mods_added += 1
+        modification_index = self.model.modification_index
+        for i in self.model.seam_range(sel_start_abs, sel_end_abs):
+            seam_abs_y = self.model.entries[i+1]['absolute_y_start']
+            if modification_index.is_restored(i):
+                logging.debug(f"接缝 {i} 已被恢复，跳过")
+                continue
+            if modification_index.is_deleted(seam_abs_y):
+                logging.debug(f"接缝 {i} 位于已删除区域内，跳过恢复操作")
+                continue
+            logging.debug(f"选区跨越接缝 {i} (abs_y: {seam_abs_y})，添加恢复修改")
+            mod = {'type': 'restore', 'seam_index': i}
+            self.model.add_modification(mod)
+            mods_added += 1
         if mods_added > 0:
             logging.debug(f"已为 {mods_added} 个接缝添加了恢复操作")
         else:
@@ -6332,110 +8137,359 @@ class PreviewPanel(SimulatedWindow):
             return (parsed.red, parsed.green, parsed.blue, parsed.alpha)
         return (0.0, 0.0, 0.0, 1.0)
 
-    def on_draw(self, widget, cr):
-        # 逻辑px
-        widget_width = widget.get_allocated_width()
-        widget_height = widget.get_allocated_height()
-        bg_color = self._get_color('preview_bg')
-        cr.set_source_rgba(*bg_color)
-        cr.paint()
-        if not self.model.render_plan:
-            text_color = self._get_color('preview_text')
-            cr.set_source_rgba(*text_color)
-            layout = PangoCairo.create_layout(cr)
-            layout.set_font_description(Pango.FontDescription("Sans 24"))
-            layout.set_text("暂无截图", -1)
-            text_width, text_height = layout.get_pixel_size()
-            x = (widget_width - text_width) // 2
-            y = (widget_height - text_height) // 2
-            cr.move_to(x, y)
-            PangoCairo.show_layout(cr, layout)
-            return
-        monitor_scale = self.parent_overlay.session.scale
-        draw_area_w = self.drawing_area_width
-        draw_area_h = self.drawing_area_height
-        draw_x_offset = (widget_width - draw_area_w) // 2 if widget_width > draw_area_w else 0
-        cr.translate(draw_x_offset, self.initial_y_offset)
-        final_scale = self.effective_scale_factor / monitor_scale
-        cr.scale(final_scale, final_scale) # 缓冲区px -> 原逻辑px -> 屏幕逻辑px
+    def _update_load_roi(self, visible_y1_model, visible_y2_model):
+        """根据视口所在的范围更新需要加载的图片集合及其优先级"""
         # 缓冲区px
-        clip_x1, visible_y1_widget, clip_x2, visible_y2_widget = cr.clip_extents()
-        visible_y1_model, visible_y2_model = cr.clip_extents()[1::2]
-        model_y_positions = [p['render_y_start'] for p in self.model.render_plan]
-        first_index = max(0, bisect.bisect_right(model_y_positions, visible_y1_model) - 1)
+        plan = self.model.render_plan
+        plan_len = len(plan)
+        model_y_positions = plan.column('render_y_start')
+        plan_heights = plan.column('height')
+        first_index = plan.index_at_render_y(visible_y1_model)
         current_roi_set = set()
         preload_count = max(2, self.config.PREVIEW_CACHE_SIZE // 5)
-        current_loop_index = first_index
-        while current_loop_index < len(self.model.render_plan):
-            piece = self.model.render_plan[current_loop_index]
-            dest_y = piece['render_y_start']
-            if dest_y >= visible_y2_model:
-                break
-            current_roi_set.add(piece['filepath'])
-            current_loop_index += 1
+        current_loop_index = int(np.searchsorted(model_y_positions, visible_y2_model, side='left'))
+        current_loop_index = max(current_loop_index, first_index)
+        current_roi_set.update(plan.filepaths[first_index:current_loop_index])
         preload_indices = []
         if self.scroll_dy > 0:
             start_preload = current_loop_index
-            preload_indices.extend(range(start_preload, min(len(self.model.render_plan), start_preload + preload_count)))
+            preload_indices.extend(range(start_preload, min(plan_len, start_preload + preload_count)))
         elif self.scroll_dy < 0:
             end_preload = first_index
             preload_indices.extend(range(max(0, end_preload - preload_count), end_preload))
         else:
             half = max(1, preload_count // 2)
             preload_indices.extend(range(max(0, first_index - half), first_index))
-            preload_indices.extend(range(current_loop_index, min(len(self.model.render_plan), current_loop_index + half)))
+            preload_indices.extend(range(current_loop_index, min(plan_len, current_loop_index + half)))
         for idx in preload_indices:
-            current_roi_set.add(self.model.render_plan[idx]['filepath'])
-        if current_roi_set != self.last_roi_set:
-            self.model.update_roi(current_roi_set)
+            current_roi_set.add(plan.filepaths[idx])
+        scroll_direction = (self.scroll_dy > 0) - (self.scroll_dy < 0)
+        roi_key = (first_index, current_loop_index, scroll_direction)
+        if current_roi_set != self.last_roi_set or roi_key != self.last_roi_key:
+            # 视口内的图片最先加载，其次是滚动方向前方的预加载图片，同一层级内离视口中心越近越先加载
+            viewport_center = (visible_y1_model + visible_y2_model) / 2
+            priorities = {}
+            for idx in itertools.chain(range(first_index, current_loop_index), preload_indices):
+                piece_center = model_y_positions[idx] + plan_heights[idx] / 2
+                offset = piece_center - viewport_center
+                if first_index <= idx < current_loop_index:
+                    tier = 0
+                elif scroll_direction == 0 or offset * scroll_direction > 0:
+                    tier = 1
+                else:
+                    tier = 2
+                priority = (tier, float(abs(offset)))
+                filepath = plan.filepaths[idx]
+                if filepath not in priorities or priority < priorities[filepath]:
+                    priorities[filepath] = priority
+            self.model.update_roi(current_roi_set, priorities)
             self.last_roi_set = current_roi_set
-        for i in range(first_index, len(self.model.render_plan)):
-            piece = self.model.render_plan[i]
-            filepath = piece.get('filepath')
-            entry_index = piece.get('entry_index')
-            src_y = piece.get('src_y', 0)
-            src_height = piece.get('height', 0)
-            dest_y = model_y_positions[i]
+            self.last_roi_key = roi_key
+
+    def _invalidate_render_range(self, render_y1, render_y2=None):
+        """标记后备缓冲中 [render_y1, render_y2) 的内容需要重绘，render_y2 为 None 表示直到末尾"""
+        # 缓冲区px
+        self._dirty_render_spans.append((render_y1, render_y2))
+
+    def _on_model_image_ready(self, model, filepath, surface):
+        if self._backing is not None and self.model.render_plan:
+            # 逻辑px -> 缓冲区px
+            final_scale = self.effective_scale_factor / self.parent_overlay.session.scale
+            _, by, _, bh = self._backing_rect
+            plan = self.model.render_plan
+            render_y_starts = plan.column('render_y_start')
+            first = plan.index_at_render_y((by - self.initial_y_offset) / final_scale)
+            last = int(np.searchsorted(render_y_starts, (by + bh - self.initial_y_offset) / final_scale, side='left'))
+            for i in range(first, last):
+                if plan.filepaths[i] == filepath:
+                    start = int(render_y_starts[i])
+                    self._invalidate_render_range(start, start + int(plan.column('height')[i]))
+        self.drawing_area.queue_draw()
+
+    @staticmethod
+    def _create_backing(widget, w, h, device_scale):
+        # 由 GDK 设置设备缩放，pycairo 1.14 之前没有 set_device_scale
+        return widget.get_window().create_similar_image_surface(cairo.FORMAT_ARGB32, w * device_scale, h * device_scale, device_scale)
+
+    def _refresh_backing(self, widget, rect, backing_key, draw_x_offset, final_scale, bg_color):
+        # 逻辑px
+        x, y, w, h = rect
+        device_scale = widget.get_scale_factor()
+        dirty_spans = []
+        old_backing, old_rect = self._backing, self._backing_rect
+        if old_backing is None or backing_key != self._backing_key or old_rect[0] != x or old_rect[2:] != (w, h):
+            self._backing = self._create_backing(widget, w, h, device_scale)
+            dirty_spans.append((y, y + h))
+            self._dirty_render_spans.clear()
+        elif old_rect[1] != y:
+            # 滚动：整体平移已有内容，只绘制新露出的条带
+            old_y = old_rect[1]
+            self._backing = self._create_backing(widget, w, h, device_scale)
+            blit_cr = cairo.Context(self._backing)
+            blit_cr.set_operator(cairo.OPERATOR_SOURCE)
+            blit_cr.set_source_surface(old_backing, 0, old_y - y)
+            blit_cr.paint()
+            if y < old_y:
+                dirty_spans.append((y, min(old_y, y + h)))
+            if y + h > old_y + h:
+                dirty_spans.append((max(old_y + h, y), y + h))
+        self._backing_key = backing_key
+        self._backing_rect = rect
+        # 缓冲区px -> 逻辑px
+        for render_y1, render_y2 in self._dirty_render_spans:
+            span_y1 = self.initial_y_offset + render_y1 * final_scale
+            span_y2 = y + h if render_y2 is None else self.initial_y_offset + render_y2 * final_scale
+            dirty_spans.append((math.floor(span_y1) - 1, math.ceil(span_y2) + 1))
+        self._dirty_render_spans.clear()
+        for span_y1, span_y2 in dirty_spans:
+            span_y1, span_y2 = max(y, span_y1), min(y + h, span_y2)
+            if span_y2 <= span_y1:
+                continue
+            backing_cr = cairo.Context(self._backing)
+            backing_cr.translate(-x, -y)
+            backing_cr.rectangle(x, span_y1, w, span_y2 - span_y1)
+            backing_cr.clip()
+            backing_cr.set_source_rgba(*bg_color)
+            backing_cr.paint()
+            backing_cr.translate(draw_x_offset, self.initial_y_offset)
+            backing_cr.scale(final_scale, final_scale) # 缓冲区px -> 原逻辑px -> 屏幕逻辑px
+            # 缓冲区px
+            self._draw_pieces(backing_cr, (span_y1 - self.initial_y_offset) / final_scale, (span_y2 - self.initial_y_offset) / final_scale, final_scale)
+
+    def _paint_thumbnail_piece(self, cr, entry_index, dest_y, src_y, src_height):
+        """用条目的缩略图绘制一个片段，cr 的单位为缓冲区px"""
+        entry = self.model.entries[entry_index] if 0 <= entry_index < len(self.model.entries) else None
+        thumb_bundle = entry.get('thumb') if entry else None
+        if not thumb_bundle:
+            return
+        thumb_surface, _ = thumb_bundle
+        cr.save()
+        cr.set_antialias(cairo.ANTIALIAS_NONE)
+        cr.translate(0, dest_y)
+        orig_h = entry['height']
+        thumb_h = thumb_surface.get_height()
+        thumb_w = thumb_surface.get_width()
+        scale_y = orig_h / thumb_h if thumb_h > 0 else 1
+        scale_x = self.model.image_width / thumb_w if thumb_w > 0 else 1
+        cr.scale(scale_x, scale_y)
+        t_src_y = src_y / scale_y
+        cr.set_source_surface(thumb_surface, 0, -t_src_y)
+        cr.get_source().set_extend(cairo.EXTEND_PAD)
+        cr.rectangle(0, 0, thumb_w, src_height / scale_y)
+        cr.fill()
+        cr.restore()
+
+    def _update_minimap(self, dirty_span):
+        """把渲染层中发生变化的部分用缩略图重新合成到小地图上"""
+        plan = self.model.render_plan
+        image_width = self.model.image_width
+        if not plan or image_width <= 0:
+            self._minimap_surface = None
+            self._minimap_height = 0
+            self.minimap_area.queue_draw()
+            return
+        first_thumb = self.model.entries[0].get('thumb') if self.model.entries else None
+        minimap_w = first_thumb[0].get_width() if first_thumb else self.MINIMAP_WIDTH
+        minimap_scale = minimap_w / image_width # 缓冲区px -> 小地图px
+        total_height = self.model.total_virtual_height
+        minimap_scale_y = minimap_scale
+        if total_height * minimap_scale > self.MINIMAP_MAX_HEIGHT:
+            # 超出图像面上限时纵向压缩，一次压缩到上限的一半，避免每次更新都整体重绘
+            if minimap_scale == self._minimap_scale and self._minimap_scale_y < minimap_scale:
+                minimap_scale_y = self._minimap_scale_y
+            if total_height * minimap_scale_y > self.MINIMAP_MAX_HEIGHT:
+                minimap_scale_y = self.MINIMAP_MAX_HEIGHT / (total_height * 2)
+        needed_h = max(1, min(self.MINIMAP_MAX_HEIGHT, math.ceil(total_height * minimap_scale_y)))
+        if (self._minimap_surface is None or minimap_scale != self._minimap_scale or minimap_scale_y != self._minimap_scale_y
+                or self._minimap_surface.get_width() != minimap_w):
+            self._minimap_surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, minimap_w, min(self.MINIMAP_MAX_HEIGHT, max(64, needed_h * 2)))
+            self._minimap_scale = minimap_scale
+            self._minimap_scale_y = minimap_scale_y
+            dirty_span = (0, None)
+        elif needed_h > self._minimap_surface.get_height():
+            grown = cairo.ImageSurface(cairo.FORMAT_ARGB32, minimap_w, min(self.MINIMAP_MAX_HEIGHT, needed_h * 2))
+            grown_cr = cairo.Context(grown)
+            grown_cr.set_source_surface(self._minimap_surface, 0, 0)
+            grown_cr.paint()
+            self._minimap_surface = grown
+        self._minimap_height = needed_h
+        if dirty_span is not None:
+            # 缓冲区px
+            render_y1, render_y2 = dirty_span
+            if render_y2 is None:
+                render_y2 = self._minimap_surface.get_height() / minimap_scale_y
+            cr = cairo.Context(self._minimap_surface)
+            cr.scale(minimap_scale, minimap_scale_y)
+            cr.rectangle(0, render_y1, image_width, render_y2 - render_y1)
+            cr.clip()
+            cr.set_operator(cairo.OPERATOR_CLEAR)
+            cr.paint()
+            cr.set_operator(cairo.OPERATOR_OVER)
+            render_y_starts = plan.column('render_y_start')
+            plan_heights = plan.column('height')
+            plan_src_ys = plan.column('src_y')
+            plan_entry_indices = plan.column('entry_index')
+            for i in range(plan.index_at_render_y(render_y1), len(plan)):
+                dest_y = int(render_y_starts[i])
+                if dest_y >= render_y2:
+                    break
+                self._paint_thumbnail_piece(cr, int(plan_entry_indices[i]), dest_y, int(plan_src_ys[i]), int(plan_heights[i]))
+        self.minimap_area.queue_draw()
+
+    def _get_minimap_scales(self):
+        # 小地图px -> 逻辑px，宽度铺满，内容过长时纵向压缩以完整显示
+        width = self.minimap_area.get_allocated_width()
+        height = self.minimap_area.get_allocated_height()
+        scale_x = width / self._minimap_surface.get_width()
+        scale_y = min(scale_x, height / self._minimap_height)
+        return scale_x, scale_y
+
+    def _on_minimap_draw(self, widget, cr):
+        # 逻辑px
+        cr.set_source_rgba(*self._get_color('preview_bg'))
+        cr.paint()
+        if self._minimap_surface is None or self._minimap_height <= 0:
+            return
+        scale_x, scale_y = self._get_minimap_scales()
+        cr.save()
+        cr.scale(scale_x, scale_y)
+        cr.set_source_surface(self._minimap_surface, 0, 0)
+        cr.get_source().set_filter(cairo.FILTER_GOOD)
+        cr.rectangle(0, 0, self._minimap_surface.get_width(), self._minimap_height)
+        cr.fill()
+        cr.restore()
+        v_adj = self.scrolled_window.get_vadjustment()
+        if v_adj and self.drawing_area_height > 0:
+            content_h = self._minimap_height * scale_y
+            frac1 = (v_adj.get_value() - self.initial_y_offset) / self.drawing_area_height
+            frac2 = (v_adj.get_value() + v_adj.get_page_size() - self.initial_y_offset) / self.drawing_area_height
+            y1 = max(0.0, min(1.0, frac1)) * content_h
+            y2 = max(0.0, min(1.0, frac2)) * content_h
+            cr.set_source_rgba(*self._get_color('preview_minimap_viewport'))
+            cr.rectangle(0, y1, widget.get_allocated_width(), max(2.0, y2 - y1))
+            cr.fill()
+
+    def _jump_to_minimap_y(self, y):
+        # 逻辑px
+        v_adj = self.scrolled_window.get_vadjustment()
+        if not v_adj or self._minimap_surface is None or self._minimap_height <= 0:
+            return
+        _, scale_y = self._get_minimap_scales()
+        frac = max(0.0, min(1.0, y / (self._minimap_height * scale_y)))
+        target = self.initial_y_offset + frac * self.drawing_area_height - v_adj.get_page_size() / 2
+        v_adj.set_value(max(v_adj.get_lower(), min(target, v_adj.get_upper() - v_adj.get_page_size())))
+
+    def _on_minimap_button_press(self, widget, event):
+        if event.button == 1:
+            self._minimap_dragging = True
+            self._jump_to_minimap_y(event.y)
+        return True
+
+    def _on_minimap_motion_notify(self, widget, event):
+        if self._minimap_dragging:
+            self._jump_to_minimap_y(event.y)
+        return True
+
+    def _on_minimap_button_release(self, widget, event):
+        if event.button == 1:
+            self._minimap_dragging = False
+        return True
+
+    def _draw_pieces(self, cr, visible_y1_model, visible_y2_model, final_scale):
+        # 缓冲区px
+        plan = self.model.render_plan
+        plan_len = len(plan)
+        model_y_positions = plan.column('render_y_start')
+        plan_heights = plan.column('height')
+        plan_src_ys = plan.column('src_y')
+        plan_entry_indices = plan.column('entry_index')
+        first_index = plan.index_at_render_y(visible_y1_model)
+        # 每个缓冲区px在屏幕上不足 1/level 个物理像素时，改用对应的降采样图
+        mip_level = 1
+        for level in self.model.MIP_LEVELS:
+            if self.effective_scale_factor * level <= 1.0:
+                mip_level = level
+        for i in range(first_index, plan_len):
+            filepath = plan.filepaths[i]
+            entry_index = int(plan_entry_indices[i])
+            src_y = int(plan_src_ys[i])
+            src_height = int(plan_heights[i])
+            dest_y = int(model_y_positions[i])
             dest_h = src_height
             if dest_y >= visible_y2_model:
                 break
             if dest_y + dest_h <= visible_y1_model:
                 continue
-            bundle = self.model.request_image(filepath)
+            bundle = self.model.request_image(filepath, mip_level)
+            draw_level = mip_level
+            if not bundle and mip_level > 1:
+                bundle = self.model.peek_image(filepath)
+                draw_level = 1
             if not bundle:
-                entry = self.model.entries[entry_index] if 0 <= entry_index < len(self.model.entries) else None
-                thumb_bundle = entry.get('thumb') if entry else None
-                if thumb_bundle:
-                    thumb_surface, _ = thumb_bundle
-                    cr.save()
-                    cr.set_antialias(cairo.ANTIALIAS_NONE)
-                    cr.translate(0, dest_y)
-                    orig_h = entry['height']
-                    thumb_h = thumb_surface.get_height()
-                    thumb_w = thumb_surface.get_width()
-                    scale_y = orig_h / thumb_h if thumb_h > 0 else 1
-                    scale_x = self.model.image_width / thumb_w if thumb_w > 0 else 1
-                    cr.scale(scale_x, scale_y)
-                    t_src_y = src_y / scale_y
-                    cr.set_source_surface(thumb_surface, 0, -t_src_y)
-                    cr.get_source().set_extend(cairo.EXTEND_PAD)
-                    cr.rectangle(0, 0, thumb_w, src_height / scale_y)
-                    cr.fill()
-                    cr.restore()
+                self._paint_thumbnail_piece(cr, entry_index, dest_y, src_y, src_height)
                 continue
             surface, _ = bundle
             original_width = surface.get_width()
             cr.save()
             try:
                 cr.translate(0, dest_y)
-                cr.set_source_surface(surface, 0, -src_y)
+                if draw_level > 1:
+                    cr.scale(draw_level, draw_level)
+                cr.set_source_surface(surface, 0, -src_y / draw_level)
                 cr.get_source().set_extend(cairo.EXTEND_PAD)
-                cr.rectangle(0, 0, original_width, src_height + 1.0 / final_scale)
+                cr.rectangle(0, 0, original_width, (src_height + 1.0 / final_scale) / draw_level)
                 cr.fill()
             except Exception as e:
                 logging.error(f"绘制 surface {Path(filepath).name} 时出错: {e}")
             finally:
                 cr.restore()
+
+    def on_draw(self, widget, cr):
+        # 逻辑px
+        widget_width = widget.get_allocated_width()
+        widget_height = widget.get_allocated_height()
+        bg_color = self._get_color('preview_bg')
+        cr.set_source_rgba(*bg_color)
+        cr.paint()
+        if not self.model.render_plan:
+            self._backing = None
+            text_color = self._get_color('preview_text')
+            cr.set_source_rgba(*text_color)
+            layout = PangoCairo.create_layout(cr)
+            layout.set_font_description(Pango.FontDescription("Sans 24"))
+            layout.set_text("暂无截图", -1)
+            text_width, text_height = layout.get_pixel_size()
+            x = (widget_width - text_width) // 2
+            y = (widget_height - text_height) // 2
+            cr.move_to(x, y)
+            PangoCairo.show_layout(cr, layout)
+            return
+        monitor_scale = self.parent_overlay.session.scale
+        draw_area_w = self.drawing_area_width
+        draw_area_h = self.drawing_area_height
+        draw_x_offset = (widget_width - draw_area_w) // 2 if widget_width > draw_area_w else 0
+        final_scale = self.effective_scale_factor / monitor_scale
+        # 后备缓冲覆盖视口和本次重绘区域，滚动时复用已有内容，只绘制新露出和失效的条带
+        clip_x1, clip_y1, clip_x2, clip_y2 = cr.clip_extents()
+        h_adj = self.scrolled_window.get_hadjustment()
+        v_adj = self.scrolled_window.get_vadjustment()
+        view_x1 = min(clip_x1, h_adj.get_value()) if h_adj else clip_x1
+        view_x2 = max(clip_x2, h_adj.get_value() + h_adj.get_page_size()) if h_adj else clip_x2
+        view_y1 = min(clip_y1, v_adj.get_value()) if v_adj else clip_y1
+        view_y2 = max(clip_y2, v_adj.get_value() + v_adj.get_page_size()) if v_adj else clip_y2
+        view_x1, view_y1 = max(0, math.floor(view_x1)), max(0, math.floor(view_y1))
+        view_x2, view_y2 = min(widget_width, math.ceil(view_x2)), min(widget_height, math.ceil(view_y2))
+        if view_x2 <= view_x1 or view_y2 <= view_y1:
+            return
+        # 缓冲区px
+        self._update_load_roi((view_y1 - self.initial_y_offset) / final_scale, (view_y2 - self.initial_y_offset) / final_scale)
+        backing_key = (self.effective_scale_factor, final_scale, draw_x_offset, self.initial_y_offset, widget.get_scale_factor(), bg_color, self.model.image_width)
+        self._refresh_backing(widget, (view_x1, view_y1, view_x2 - view_x1, view_y2 - view_y1), backing_key, draw_x_offset, final_scale, bg_color)
+        bx, by, _, _ = self._backing_rect
+        cr.set_source_surface(self._backing, bx, by)
+        cr.paint()
+        cr.translate(draw_x_offset, self.initial_y_offset)
+        cr.scale(final_scale, final_scale) # 缓冲区px -> 原逻辑px -> 屏幕逻辑px
         # 如果在选择模式下，绘制蒙版和选框
         current_scale = final_scale
         if self.is_selection_mode:
@@ -6484,26 +8538,30 @@ class PreviewPanel(SimulatedWindow):
                     cr.line_to(total_draw_x_start + total_draw_width, seam_y_render)
                     cr.stroke()
                     cr.set_dash([])
-                restored_seam_indices = {mod['seam_index'] for mod in self.model.modifications if mod['type'] == 'restore'}
+                modification_index = self.model.modification_index
                 cr.set_line_width(3.0 / current_scale)
                 cr.set_dash([8.0 / current_scale, 6.0 / current_scale])
                 unmatched_color = self._get_color('preview_unmatched_seam')
                 matched_color = self._get_color('preview_matched_seam')
-                for i, entry in enumerate(self.model.entries[:-1]):
+                # 只枚举选区与当前重绘区域交集内的接缝
+                _, clip_y1, _, clip_y2 = cr.clip_extents()
+                visible_abs_y1 = self._render_y_to_absolute_y(clip_y1)
+                visible_abs_y2 = self._render_y_to_absolute_y(clip_y2) + 1
+                for i in self.model.seam_range(max(sel_start_abs, visible_abs_y1), min(sel_end_abs, visible_abs_y2)):
+                    entry = self.model.entries[i]
                     next_entry = self.model.entries[i+1]
                     seam_start_abs = next_entry['absolute_y_start']
-                    if sel_start_abs <= seam_start_abs < sel_end_abs:
-                        if any(del_start <= seam_start_abs < del_end for del_start, del_end in self.model.merged_del_regions):
-                            continue
-                        has_cropping = (entry['crop_bottom'] < entry['height']) or (next_entry['crop_top'] > 0)
-                        if (not has_cropping) or (i in restored_seam_indices):
-                            cr.set_source_rgba(*unmatched_color)
-                        else:
-                            cr.set_source_rgba(*matched_color)
-                        seam_y_render = self._absolute_y_to_render_y(seam_start_abs)
-                        cr.move_to(total_draw_x_start, seam_y_render)
-                        cr.line_to(total_draw_x_start + total_draw_width, seam_y_render)
-                        cr.stroke()
+                    if modification_index.is_deleted(seam_start_abs):
+                        continue
+                    has_cropping = (entry['crop_bottom'] < entry['height']) or (next_entry['crop_top'] > 0)
+                    if (not has_cropping) or modification_index.is_restored(i):
+                        cr.set_source_rgba(*unmatched_color)
+                    else:
+                        cr.set_source_rgba(*matched_color)
+                    seam_y_render = self._absolute_y_to_render_y(seam_start_abs)
+                    cr.move_to(total_draw_x_start, seam_y_render)
+                    cr.line_to(total_draw_x_start + total_draw_width, seam_y_render)
+                    cr.stroke()
                 cr.set_dash([])
 
     def _on_drawing_area_button_press(self, widget, event):
@@ -0,0 +1,23 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def scroll_stitch():
+    """导入主程序模块，缺少 GTK / cairo / OpenCV 运行环境时跳过"""
+    return pytest.importorskip("scroll_stitch", reason="需要 GTK、cairo 和 OpenCV 运行环境")
+
+
+@pytest.fixture
+def config(scroll_stitch, tmp_path, monkeypatch):
+    """载入默认配置并把临时目录指向 tmp_path"""
+    cfg = scroll_stitch.Config()
+    cfg.TEMP_DIRECTORY = tmp_path
+    cfg.INCREMENTAL_COMPOSITE = False
+    cfg.PREVIEW_LOADER_THREADS = 1
+    monkeypatch.setattr(scroll_stitch, "config", cfg, raising=False)
+    return cfg
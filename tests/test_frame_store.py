@@ -0,0 +1,25 @@
+import threading
+
+import numpy as np
+
+
+def test_removed_frame_is_not_stored_by_late_compression(scroll_stitch, monkeypatch):
+    store = scroll_stitch.CompressedFrameStore(64 * 1024 * 1024)
+    release = threading.Event()
+    compress = scroll_stitch.zlib.compress
+    monkeypatch.setattr(scroll_stitch.zlib, "compress", lambda *args: (release.wait(5), compress(*args))[1])
+    frame = np.zeros((100, 100, 3), dtype=np.uint8)
+    store.submit("0.png", frame)
+    store.remove("0.png")
+    release.set()
+    store.close()
+    assert "0.png" not in store
+    assert store.nbytes == 0 and store.raw_nbytes == 0
+
+
+def test_frame_can_be_stored_again_after_removal(scroll_stitch):
+    store = scroll_stitch.CompressedFrameStore(64 * 1024 * 1024)
+    store.remove("0.png")
+    store.submit("0.png", np.zeros((10, 10, 3), dtype=np.uint8))
+    store.close()
+    assert "0.png" in store
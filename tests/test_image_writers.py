@@ -0,0 +1,75 @@
+import zlib
+
+import numpy as np
+import pytest
+
+
+def _sample_image(height, width, seed=0):
+    # 重复的行块让压缩块跨越行带引用预设字典中的数据
+    block = np.random.default_rng(seed).integers(0, 256, (37, width, 3), dtype=np.uint8)
+    return np.ascontiguousarray(np.resize(block, (height, width, 3)))
+
+
+def _read_image(scroll_stitch, path):
+    decoded = scroll_stitch.cv2.imread(str(path), scroll_stitch.cv2.IMREAD_UNCHANGED)
+    assert decoded is not None, f"无法解码 {path}"
+    return decoded
+
+
+@pytest.mark.parametrize("threads", [1, 2, 3, 5])
+@pytest.mark.parametrize("height", [1, 256, 700])
+def test_streaming_png_round_trip(scroll_stitch, config, tmp_path, threads, height):
+    image = _sample_image(height, 83)
+    output_file = tmp_path / "out.png"
+    bands = scroll_stitch.iter_canvas_bands(image, scroll_stitch.StreamingPNGWriter.BAND_HEIGHT)
+    assert scroll_stitch.write_png_from_bands(output_file, 83, height, bands, threads=threads)
+    np.testing.assert_array_equal(_read_image(scroll_stitch, output_file), image)
+
+
+def test_streaming_png_rejects_missing_rows(scroll_stitch, tmp_path):
+    output_file = tmp_path / "out.png"
+    with pytest.raises(RuntimeError):
+        with scroll_stitch.StreamingPNGWriter(output_file, 10, 20) as writer:
+            writer.write_band(_sample_image(10, 10))
+    assert not output_file.exists()
+
+
+def test_adler32_combine_matches_concatenation(scroll_stitch):
+    rng = np.random.default_rng(1)
+    first = rng.integers(0, 256, 100000, dtype=np.uint8).tobytes()
+    second = rng.integers(0, 256, 70001, dtype=np.uint8).tobytes()
+    combined = scroll_stitch._adler32_combine(zlib.adler32(first), zlib.adler32(second), len(second))
+    assert combined == zlib.adler32(first + second)
+    assert scroll_stitch._adler32_combine(zlib.adler32(first), zlib.adler32(b''), 0) == zlib.adler32(first)
+
+
+@pytest.mark.parametrize("threads", [1, 2, 3])
+@pytest.mark.parametrize("encoded_bands", [0, 1, 3, 4])
+def test_png_with_encoded_prefix_matches_fresh_encode(scroll_stitch, config, tmp_path, threads, encoded_bands):
+    band_height = scroll_stitch.StreamingPNGWriter.BAND_HEIGHT
+    canvas = _sample_image(band_height * 4 + 45, 91, seed=2)
+    config.ENCODER_THREADS = threads
+    # 与增量合成一样，每个行带由画布独立计算起始状态后预编码
+    encoded_blocks = []
+    for k in range(encoded_bands):
+        band_y = k * band_height
+        prev_row, prev_tail = scroll_stitch.StreamingPNGWriter.state_before(canvas, band_y, band_height)
+        encoded_blocks.append(scroll_stitch.StreamingPNGWriter.encode_band(canvas[band_y:band_y + band_height], prev_row, prev_tail))
+    fresh_file = tmp_path / "fresh.png"
+    prefixed_file = tmp_path / "prefixed.png"
+    assert scroll_stitch.write_png_from_canvas(fresh_file, canvas)
+    assert scroll_stitch.write_png_from_canvas(prefixed_file, canvas, encoded_blocks)
+    assert prefixed_file.read_bytes() == fresh_file.read_bytes()
+    np.testing.assert_array_equal(_read_image(scroll_stitch, prefixed_file), canvas)
+
+
+@pytest.mark.parametrize("threads", [1, 2, 3])
+@pytest.mark.parametrize("preset", ["fast", "balanced"])
+@pytest.mark.parametrize("height", [1, 256, 600])
+def test_tiled_tiff_round_trip(scroll_stitch, config, tmp_path, threads, preset, height):
+    config.ENCODE_PRESET = preset
+    image = _sample_image(height, 300, seed=3)
+    output_file = tmp_path / "out.tif"
+    bands = scroll_stitch.iter_canvas_bands(image, scroll_stitch.StreamingTiledTIFFWriter.TILE_SIZE)
+    assert scroll_stitch.write_tiff_from_bands(output_file, 300, height, bands, threads=threads)
+    np.testing.assert_array_equal(_read_image(scroll_stitch, output_file), image)
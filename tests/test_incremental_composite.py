@@ -0,0 +1,24 @@
+import logging
+
+import numpy as np
+
+
+def test_replace_with_deleted_capture_is_quiet(scroll_stitch, config, tmp_path, caplog):
+    frame = np.full((40, 30, 3), 200, dtype=np.uint8)
+    frames = {"kept.png": frame}
+    composite = scroll_stitch.IncrementalComposite(tmp_path / "composite.rgb", frames.get)
+    pieces = [
+        {'filepath': "kept.png", 'render_y_start': 0, 'height': 40, 'src_y': 0},
+        # 截图在 replace 排队期间已被撤销，文件和内存缓存都不存在
+        {'filepath': str(tmp_path / "popped.png"), 'render_y_start': 40, 'height': 20, 'src_y': 0},
+    ]
+    try:
+        with caplog.at_level(logging.DEBUG):
+            composite.replace(0, 0, pieces, 30, 60)
+            canvas = composite.finish(60)
+        assert canvas is not None
+        np.testing.assert_array_equal(canvas[:40], frame)
+        assert not canvas[40:].any()
+        assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    finally:
+        composite.close()
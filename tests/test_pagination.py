@@ -0,0 +1,9 @@
+def test_composed_page_workers_bounded_by_available_memory(scroll_stitch, monkeypatch):
+    page_bytes = 3840 * 65500 * 3
+    interaction = scroll_stitch.SystemInteraction
+    monkeypatch.setattr(interaction, "get_available_memory", classmethod(lambda cls: page_bytes * 4))
+    assert scroll_stitch.composed_page_workers(3840, 65500) == 2
+    monkeypatch.setattr(interaction, "get_available_memory", classmethod(lambda cls: page_bytes // 10))
+    assert scroll_stitch.composed_page_workers(3840, 65500) == 1
+    monkeypatch.setattr(interaction, "get_available_memory", classmethod(lambda cls: None))
+    assert scroll_stitch.composed_page_workers(3840, 65500) == 1
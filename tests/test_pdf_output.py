@@ -0,0 +1,45 @@
+import re
+import zlib
+
+import numpy as np
+import pytest
+
+
+def _pdf_objects(data):
+    """返回 PDF 原文和所有可解压的流内容，cairo 较新版本会把对象放在压缩的对象流中"""
+    chunks = [data]
+    for stream in re.findall(rb"stream\r?\n(.*?)endstream", data, re.S):
+        try:
+            chunks.append(zlib.decompressobj().decompress(stream))
+        except zlib.error:
+            pass
+    return b"\n".join(chunks)
+
+
+def test_write_pdf_from_canvas_writes_two_pages(scroll_stitch, config, tmp_path):
+    pytest.importorskip("cairo")
+    width, height = 120, 300
+    canvas = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    pages = [(0, 180), (180, height)]
+    output_file = tmp_path / "out.pdf"
+    progress = []
+    assert scroll_stitch.write_pdf(output_file, pages, [], canvas, width, progress_callback=progress.append)
+    data = output_file.read_bytes()
+    assert data.startswith(b"%PDF-")
+    objects = _pdf_objects(data)
+    assert len(re.findall(rb"/Type\s*/Page\b", objects)) == 2
+    assert re.search(rb"/Count\s+2\b", objects)
+    assert progress == [0.5, 1.0]
+
+
+def test_write_pdf_removes_partial_file_on_error(scroll_stitch, config, tmp_path):
+    pytest.importorskip("cairo")
+
+    class BrokenCanvas:
+        def __getitem__(self, index):
+            raise RuntimeError("读取画布失败")
+
+    output_file = tmp_path / "out.pdf"
+    with pytest.raises(RuntimeError):
+        scroll_stitch.write_pdf(output_file, [(0, 100), (100, 200)], [], BrokenCanvas(), 50)
+    assert not output_file.exists()
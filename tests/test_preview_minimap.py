@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+
+
+def _fake_panel(scroll_stitch, model):
+    panel_cls = scroll_stitch.PreviewPanel
+    return SimpleNamespace(
+        model=model,
+        MINIMAP_WIDTH=panel_cls.MINIMAP_WIDTH,
+        MINIMAP_MAX_HEIGHT=panel_cls.MINIMAP_MAX_HEIGHT,
+        _minimap_surface=None,
+        _minimap_height=0,
+        _minimap_scale=None,
+        _minimap_scale_y=None,
+        minimap_area=SimpleNamespace(queue_draw=lambda: None),
+        _paint_thumbnail_piece=lambda *args: None,
+    )
+
+
+def test_minimap_surface_stays_within_cairo_limit(scroll_stitch):
+    # 400px 宽的截图在小地图上约为 1:8，不加限制时约 26 万像素高就会超出上限
+    piece_height = 800
+    plan = scroll_stitch.RenderPlan()
+    model = SimpleNamespace(render_plan=plan, image_width=400, entries=[], total_virtual_height=0)
+    panel = _fake_panel(scroll_stitch, model)
+    update_minimap = scroll_stitch.PreviewPanel._update_minimap
+    for i in range(1500):
+        plan.append(i, f"{i}.png", 0, 0, model.total_virtual_height, piece_height, 0)
+        model.total_virtual_height += piece_height
+        update_minimap(panel, (model.total_virtual_height - piece_height, model.total_virtual_height))
+        assert panel._minimap_surface.get_height() <= panel.MINIMAP_MAX_HEIGHT
+        assert panel._minimap_height <= panel._minimap_surface.get_height()
+    assert panel._minimap_scale_y < panel._minimap_scale
+    assert model.total_virtual_height * panel._minimap_scale_y <= panel.MINIMAP_MAX_HEIGHT
@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.fixture
+def model(scroll_stitch, config):
+    stitch_model = scroll_stitch.StitchModel()
+    yield stitch_model
+    stitch_model.cleanup()
+
+
+def _plan_rows(scroll_stitch, plan):
+    return [tuple(piece[name] for name in scroll_stitch.RenderPlan.FIELDS) for piece in plan]
+
+
+def test_modification_replans_entries_whose_crop_exceeds_height(scroll_stitch, model):
+    # 未匹配时直接拼接，帧高不同会让前面条目的 crop_bottom 超出自身高度，覆盖到后面条目的范围
+    model.add_entry("0.png", 100, 300, 0, 0, 0, None, None)
+    model.add_entry("1.png", 100, 800, 1300, 0, 0, None, None)
+    model.add_entry("2.png", 100, 300, 100, 0, 0, None, None)
+    model.add_entry("3.png", 100, 300, 300, 0, 0, None, None)
+    assert model.entries[0]['crop_bottom'] > model.entries[0]['height']
+    model.add_modification({'type': 'delete', 'y_start_abs': 1150, 'y_end_abs': 1180})
+    spliced = _plan_rows(scroll_stitch, model.render_plan)
+    spliced_height = model.total_virtual_height
+    model._regenerate_plans()
+    assert spliced == _plan_rows(scroll_stitch, model.render_plan)
+    assert spliced_height == model.total_virtual_height
+
+
+def test_pending_load_counts_one_cache_miss(model):
+    with model._queue_lock:
+        model._worker_running = False
+        model._worker_condition.notify_all()
+    for _ in range(20):
+        assert model.request_image("missing.png") is None
+    assert model.cache_stats['misses'] == 1
+    assert model.cache_stats['hits'] == 0